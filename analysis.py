@@ -1,157 +1,323 @@
 import datetime
-from database import (
-    get_dates_completed, 
-    get_habit_periodicity
-)
+from model import parse_periodicity
+from storage import SQLiteBackend
+from database import iterate_completion_history
 
-def determine_completion(habit_name, table_name = "habits"):
+def determine_completed_periods(all_dates_completed_sorted, periodicity):
     """
-    Determines if a habit has been completed for the current day or week.
+    Determines the periods in which a habit has met its quota.
 
-    This function checks if a given habit has been completed based on its periodicity 
-    (daily or weekly). It retrieves the completion dates and periodicity from the 
-    specified table in the database and compares the current date with the most recent 
-    completion date.
+    This function walks once through the sorted completion dates of a habit, maps
+    each date to its period ordinal and counts the distinct completion days per
+    period. A period is regarded as completed as soon as the number of completion
+    days reaches the quota of the periodicity. Several completions on the same day
+    count as one.
+
+    Parameters:
+    - all_dates_completed_sorted (list of datetime): The completion dates of the
+      habit, sorted in ascending order.
+    - periodicity (Periodicity): The periodicity of the habit.
+
+    Returns:
+    - completed_periods (list of int): The ordinals of the completed periods
+      in ascending order.
+    """
+    completed_periods = []
+    last_day = None
+    period = None
+    completion_days = 0
+
+    for date_completed in all_dates_completed_sorted:
+        day = date_completed.toordinal()
+        # Several completions on the same day count as one
+        if day == last_day:
+            continue
+        last_day = day
+
+        current_period = periodicity.period_of(date_completed)
+        if current_period != period:
+            period = current_period
+            completion_days = 0
+        completion_days += 1
+
+        # The period is completed exactly once, when its quota is reached
+        if completion_days == periodicity.quota:
+            completed_periods.append(period)
+
+    return completed_periods
+
+
+def determine_completed_period_runs(completion_segments, periodicity):
+    """
+    Determines the runs of consecutive periods in which a habit has met its quota.
+
+    This function gives the same periods as determine_completed_periods(), but 
+    works on runs of consecutive completion days. Only the first and the last 
+    period of every run are counted day by day. The periods in between lie 
+    completely within the run, so all their days are completed and they are 
+    added as a whole. The work therefore depends on the number of runs, not on 
+    the number of completion days.
+
+    Parameters:
+    - completion_segments (list of (int, int)): The runs of completion days as 
+      (first day, last day) ordinals, sorted in ascending order and neither 
+      overlapping nor touching each other, see get_completion_segments().
+    - periodicity (Periodicity): The periodicity of the habit.
+
+    Returns:
+    - completed_period_runs (list of (int, int)): The runs of consecutive completed 
+      periods as (first period, last period) ordinals in ascending order.
+    """
+    completed_period_runs = []
+    period = None
+    completion_days = 0
+
+    def add_completed_periods(first_period, last_period):
+        if completed_period_runs and first_period <= completed_period_runs[-1][1] + 1:
+            completed_period_runs[-1] = (completed_period_runs[-1][0], last_period)
+        else:
+            completed_period_runs.append((first_period, last_period))
+
+    def add_completion_days(current_period, days):
+        nonlocal period, completion_days
+        if current_period != period:
+            period = current_period
+            completion_days = 0
+        # The period is completed exactly once, when its quota is reached
+        if completion_days < periodicity.quota <= completion_days + days:
+            add_completed_periods(period, period)
+        completion_days += days
+
+    for start_day, end_day in completion_segments:
+        first_period = periodicity.period_of(datetime.date.fromordinal(start_day))
+        last_period = periodicity.period_of(datetime.date.fromordinal(end_day))
+        if first_period == last_period:
+            add_completion_days(first_period, end_day - start_day + 1)
+            continue
+
+        add_completion_days(first_period, periodicity.first_day_of(first_period + 1) - start_day)
+        # Every period has at least as many days as its quota, so fully covered periods are completed
+        if last_period - first_period > 1:
+            add_completed_periods(first_period + 1, last_period - 1)
+        add_completion_days(last_period, end_day - periodicity.first_day_of(last_period) + 1)
+
+    return completed_period_runs
+
+
+def determine_completion(habit_name, table_name = "habits", backend = None):
+    """
+    Determines if a habit has been completed for the current period.
+
+    This function checks if a given habit has been completed based on its periodicity
+    (e.g., daily, weekly, monthly, every N days or N times per week). It retrieves the
+    completion dates and periodicity from the specified table in the database and
+    checks whether the quota of the current period has been reached.
 
     Parameters:
     - habit_name (str): The name of the habit to check for completion.
-    - table_name (str): The name of the table from which to retrieve the habit data. 
+    - table_name (str): The name of the table from which to retrieve the habit data.
       Defaults to "habits".
+    - backend (StorageBackend or None): The storage backend to retrieve the habit data
+      from. Defaults to None, which uses the SQLite table given by table_name.
 
     Returns:
-    - habit_completed (str): 'Yes' if the habit is completed for the current day 
-      or week, 'No' otherwise.
+    - habit_completed (str): 'Yes' if the habit is completed for the current period,
+      'No' otherwise.
     """
+    if backend is None:
+        backend = SQLiteBackend(table_name)
+
     # Get today's date
     today = datetime.datetime.now()
 
     # Retrieve a sorted list of completion dates for the habit
-    all_dates_completed_sorted = get_dates_completed(habit_name, table_name)
+    all_dates_completed_sorted = backend.get_dates_completed(habit_name)
 
     # Get the periodicity of the habit
-    habit_periodicity = get_habit_periodicity(habit_name, table_name)
-
-    # By default, assume the habit is completed
-    habit_completed = str('Yes')
-
-    # If there are no completion dates, the habit is not completed
-    if not all_dates_completed_sorted:
-        habit_completed = str('No')
-    # Check completion based on habit periodicity
-    elif habit_periodicity == "daily" and (today - all_dates_completed_sorted[-1]).days != 0:
-        # If last completion date is not today for daily habits, habit is not completed
-        habit_completed = str('No')
-    # For weekly habits, compare current week and year with the last completion week and year
-    elif habit_periodicity == "weekly":
-        today_week              = today.isocalendar()[1]
-        last_completion_week    = all_dates_completed_sorted[-1].isocalendar()[1]
-        today_year              = today.isocalendar()[0]
-        last_completion_year    = all_dates_completed_sorted[-1].isocalendar()[0]
-        
-        # If weeks and years are different, habit is not completed
-        if (today_year - last_completion_year) * 52 + today_week - last_completion_week != 0:
-
-            habit_completed = str('No')
-
-    # return 'Yes' or 'No'
-    return habit_completed
-
-
-def determine_streaks(habit_name, table_name = "habits"):
+    periodicity = parse_periodicity(backend.get_habit_periodicity(habit_name), backend.get_habit_date_added(habit_name))
+
+    # Determine the periods in which the habit has been completed
+    completed_periods = determine_completed_periods(all_dates_completed_sorted, periodicity)
+
+    # The habit is completed if the last completed period is the current one
+    if completed_periods and completed_periods[-1] == periodicity.period_of(today):
+        return str('Yes')
+    return str('No')
+
+
+def determine_streaks(habit_name, table_name = "habits", backend = None):
     """
     Determines the current and longest streaks for a given habit.
 
-    This function calculates the streaks for a specified habit based on its 
-    periodicity (daily or weekly) and its completion dates. A streak is defined 
-    as consecutive days or weeks in which the habit was completed. The function 
+    This function calculates the streaks for a specified habit based on its
+    periodicity and its completion dates. A streak is defined as consecutive
+    periods (e.g., days or weeks) in which the habit was completed. The function
     returns the current streak and the longest streak of the habit.
 
     Parameters:
     - habit_name (str): The name of the habit to determine streaks for.
-    - table_name (str): The name of the table from which to retrieve the habit data. 
+    - table_name (str): The name of the table from which to retrieve the habit data.
       Defaults to "habits".
+    - backend (StorageBackend or None): The storage backend to retrieve the habit data
+      from. Defaults to None, which uses the SQLite table given by table_name.
 
     Returns:
     - (int, int): A tuple containing:
-      - current_streak (int): The number of consecutive days or weeks the habit 
+      - current_streak (int): The number of consecutive periods the habit
         has been completed up to today.
-      - longest_streak (int): The longest number of consecutive days or weeks the 
+      - longest_streak (int): The longest number of consecutive periods the
         habit has been completed.
     """
-    # Get a sorted list of completion dates for the habit
-    all_dates_completed_sorted = get_dates_completed(habit_name, table_name)
+    if backend is None:
+        backend = SQLiteBackend(table_name)
+
+    # Get the full completion history of the habit as runs of consecutive days, including the archived ones
+    completion_segments = backend.get_completion_segments(habit_name)
 
     # Get the periodicity of the habit
-    habit_periodicity = get_habit_periodicity(habit_name, table_name)
+    periodicity = parse_periodicity(backend.get_habit_periodicity(habit_name), backend.get_habit_date_added(habit_name))
 
-    # If there are no completion dates, return 0 streaks
-    if not all_dates_completed_sorted:
-        return (0, 0)
+    # Determine the runs of consecutive periods in which the habit has been completed
+    completed_period_runs = determine_completed_period_runs(completion_segments, periodicity)
 
-    # Initialize streak counters
-    streak = 1
-    longest_streak = 1
-
-    # Iterate over completion dates to determine streaks
-    for i in range(1, len(all_dates_completed_sorted)):
-        is_streak = False  # Initialize is_streak to False for each iteration
-        
-        if habit_periodicity == "daily":
-            # If the difference of two successive dates is equal to one, a streak is determined
-            is_streak = (all_dates_completed_sorted[i] - all_dates_completed_sorted[i-1]).days == 1
-        elif habit_periodicity == "weekly":
-            last_completion_week    = all_dates_completed_sorted[i-1].isocalendar()[1]
-            current_completion_week = all_dates_completed_sorted[i].isocalendar()[1]
-            
-            last_completion_year    = all_dates_completed_sorted[i-1].isocalendar()[0]
-            current_completion_year = all_dates_completed_sorted[i].isocalendar()[0]
-
-            # Calculate the week difference, accounting for year difference
-            week_difference = (current_completion_year - last_completion_year) * 52 + (current_completion_week - last_completion_week)
-
-            # If a weekly habit is completed more than once in a week, the duplicate week number(s) will be skipped
-            if week_difference == 0:
-                continue
-            # If the difference of two successive weeks is equal to one, a streak is determined
-            # Taking into account the difference in years
-            elif week_difference == 1:
-                is_streak = True
-        
-        # Update streak count based on whether there's a streak or not
-        if is_streak:
-            streak += 1
-        else:
-            streak = 1
+    # If there are no completed periods, return 0 streaks
+    if not completed_period_runs:
+        return (0, 0)
 
-        # Update longest streak
-        # If streak is higher than longest_streak, longest_streak will be set to the value of streak
-        longest_streak = max(streak, longest_streak)
+    # Every run of consecutive completed periods is a streak
+    longest_streak = max(last_period - first_period + 1 for first_period, last_period in completed_period_runs)
 
-    # Set a default value for current_streak
-    current_streak = streak
+    # The last run is the current streak
+    first_period, last_period = completed_period_runs[-1]
+    current_streak = last_period - first_period + 1
 
-    # Get today's date
-    today = datetime.datetime.now()
+    # Get today's period
+    today_period = periodicity.period_of(datetime.datetime.now())
 
     # Update current streak
-    # Check if the streak is broken based on habit periodicity
-    if habit_periodicity == "daily" and (today - all_dates_completed_sorted[-1]).days > 1:
-        # If the difference is bigger than one, the current streak is set back to zero
+    # The current period may still be in progress, so the streak is only broken
+    # if neither the current nor the previous period has been completed
+    if today_period - last_period > 1:
         current_streak = 0
-    elif habit_periodicity == "weekly":
-        # Get today's week and year
-        today_week              = today.isocalendar()[1]
-        last_completion_week    = all_dates_completed_sorted[-1].isocalendar()[1]
-        
-        # Get the week and year of the last completion date
-        today_year              = today.isocalendar()[0]
-        last_completion_year    = all_dates_completed_sorted[-1].isocalendar()[0]
-
-        # Calculate the difference in weeks between today and the last completion date
-        # Taking into account the difference in years
-        if (today_year - last_completion_year) * 52 + today_week - last_completion_week > 1:
-            # If the difference is bigger than one, the current streak is set back to zero
-            current_streak = 0
 
     # Return the current streak and longest streak
     return current_streak, longest_streak
+
+
+def determine_habit_statistics(table_name = "habits", connection = None):
+    """
+    Determines statistics about the completion history of all habits.
+
+    This function streams the full completion history of all habits, including the
+    archived one, with a single query and updates the statistics of each habit day
+    by day in one pass. No list of completion dates is built, so memory use does
+    not depend on the length of the histories.
+
+    Parameters:
+    - table_name (str): The name of the table from which to retrieve the habit data.
+      Defaults to "habits".
+    - connection (sqlite3.Connection or None): The connection to use instead of the
+      database module's connection. Defaults to None.
+
+    Returns:
+    - all_statistics (dict): Maps every habit name to a dictionary containing:
+      - total_completions (int): The number of days the habit was completed on.
+      - first_completion (str or None): The first completion date, in the format 'YYYY-MM-DD'.
+      - last_completion (str or None): The last completion date, in the format 'YYYY-MM-DD'.
+      - average_gap (float or None): The average number of days between two completions.
+      - maximum_gap (int or None): The largest number of days between two completions.
+      - weekday_distribution (list of int): The number of completions per weekday,
+        from Monday to Sunday.
+      - adherence (float or None): The share of periods since the habit was added (or
+        first completed, if earlier) in which the habit was completed. The current
+        period only counts once it is completed.
+    """
+    today = datetime.datetime.now()
+    all_statistics = {}
+    habit_name = None
+    habit_statistics = None
+
+    for row_habit_name, habit_periodicity, date_added, start_date, end_date in iterate_completion_history(table_name, connection):
+        # Rows are ordered by habit, so a new name means the previous habit is complete
+        if row_habit_name != habit_name:
+            if habit_statistics is not None:
+                all_statistics[habit_name] = habit_statistics.result(today)
+            habit_name = row_habit_name
+            habit_statistics = _HabitStatistics(parse_periodicity(habit_periodicity, date_added), date_added)
+
+        # Archived runs cover several consecutive days
+        if start_date is not None:
+            for day in range(datetime.date.fromisoformat(start_date).toordinal(), datetime.date.fromisoformat(end_date).toordinal() + 1):
+                habit_statistics.add(day)
+
+    if habit_statistics is not None:
+        all_statistics[habit_name] = habit_statistics.result(today)
+
+    return all_statistics
+
+
+class _HabitStatistics:
+    """
+    Accumulates the statistics of one habit from its completion days in ascending order.
+    """
+    def __init__(self, periodicity, date_added):
+        self.periodicity = periodicity
+        self.date_added = date_added
+        self.total_completions = 0
+        self.first_day = None
+        self.last_day = None
+        self.gap_sum = 0
+        self.maximum_gap = None
+        self.weekday_distribution = [0] * 7
+        self.period = None
+        self.period_completions = 0
+        self.completed_periods = 0
+        self.last_completed_period = None
+
+    def add(self, day):
+        # Several completions on the same day count as one, and so do archived runs 
+        # that overlap completions in the habits table
+        if self.last_day is not None and day <= self.last_day:
+            return
+
+        if self.last_day is None:
+            self.first_day = day
+        else:
+            gap = day - self.last_day
+            self.gap_sum += gap
+            self.maximum_gap = gap if self.maximum_gap is None else max(self.maximum_gap, gap)
+        self.last_day = day
+        self.total_completions += 1
+        # Day ordinal 1 (0001-01-01) is a Monday
+        self.weekday_distribution[(day - 1) % 7] += 1
+
+        # Count the completed periods like determine_completed_periods()
+        period = self.periodicity.period_of(datetime.date.fromordinal(day))
+        if period != self.period:
+            self.period = period
+            self.period_completions = 0
+        self.period_completions += 1
+        if self.period_completions == self.periodicity.quota:
+            self.completed_periods += 1
+            self.last_completed_period = period
+
+    def result(self, today):
+        today_period = self.periodicity.period_of(today)
+        start_period = self.periodicity.period_of(datetime.date.fromisoformat(self.date_added))
+        first_completion = None
+        last_completion = None
+        if self.first_day is not None:
+            start_period = min(start_period, self.periodicity.period_of(datetime.date.fromordinal(self.first_day)))
+            first_completion = datetime.date.fromordinal(self.first_day).isoformat()
+            last_completion = datetime.date.fromordinal(self.last_day).isoformat()
+        elapsed_periods = today_period - start_period + (1 if self.last_completed_period == today_period else 0)
+
+        return {
+            "total_completions":    self.total_completions,
+            "first_completion":     first_completion,
+            "last_completion":      last_completion,
+            "average_gap":          self.gap_sum / (self.total_completions - 1) if self.total_completions > 1 else None,
+            "maximum_gap":          self.maximum_gap,
+            "weekday_distribution": self.weekday_distribution,
+            "adherence":            min(self.completed_periods / elapsed_periods, 1.0) if elapsed_periods > 0 else None
+        }
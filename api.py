@@ -0,0 +1,254 @@
+import json
+import queue
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer
+)
+from urllib.parse import (
+    urlsplit,
+    parse_qs,
+    unquote
+)
+from storage import SQLiteBackend
+from analysis import (
+    determine_completion,
+    determine_streaks
+)
+from functionality import create_overview_rows
+from database import (
+    DATABASE_FILE,
+    create_table,
+    get_last_change_sequence
+)
+
+# Columns of the rows returned by create_overview_rows()
+OVERVIEW_COLUMNS = ["habit_name", "habit_task_specification", "habit_periodicity", "completed", "current_streak", "longest_streak"]
+
+
+class ConnectionPool:
+    """
+    Hands out database connections to one thread at a time.
+
+    SQLite connections must not be used by two threads at once, so every request
+    borrows a connection from the pool and returns it when it is done. Each
+    connection is wrapped in a SQLiteBackend, which is kept for the lifetime of
+    the pool, so the overview cache of the functionality module is reused across
+    requests.
+
+    Parameters:
+    - database_file (str): The database file to connect to.
+    - size (int): The number of connections. Defaults to 4.
+    - table_name (str): The name of the table where habit data is stored. Defaults to "habits".
+    """
+    def __init__(self, database_file, size = 4, table_name = "habits"):
+        self.table_name = table_name
+        self.size = size
+        self._backends = queue.Queue()
+        for _ in range(size):
+            # Each connection is only used by the thread that borrowed it
+            connection = sqlite3.connect(database_file, check_same_thread = False)
+            self._backends.put(SQLiteBackend(table_name, connection))
+        with self.backend() as backend:
+            create_table(table_name, backend.connection)
+
+    @contextmanager
+    def backend(self):
+        """
+        Borrows a backend from the pool, waiting until one is free.
+        """
+        backend = self._backends.get()
+        try:
+            yield backend
+        finally:
+            self._backends.put(backend)
+
+    def close(self):
+        """
+        Closes all connections of the pool, waiting for borrowed ones to be returned.
+        """
+        for _ in range(self.size):
+            self._backends.get().connection.close()
+
+
+class HabitRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the habit data as JSON.
+
+    Supported requests:
+    - GET /habits: All habits with their task specification and periodicity.
+    - GET /habits/<name>/completions: The completion dates of a habit, including archived ones.
+    - GET /habits/<name>/streaks: The completion status and streaks of a habit.
+    - GET /overview?periodicity=<periodicity>: The rows of the overview table, for "all"
+      habits by default.
+
+    Every response has an ETag made of the last change sequence of the data and
+    today's date, which streaks depend on. Requests with a matching If-None-Match
+    header are answered with 304 Not Modified without querying the habit data.
+    Responses whose data changed while they were built are sent without an ETag.
+    """
+    server_version = "HabitTracker/1.0"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path_parts = [unquote(part) for part in url.path.strip("/").split("/")]
+
+        with self.server.pool.backend() as backend:
+            sequence = get_last_change_sequence(backend.table_name, backend.connection)
+            etag = '"{sequence}-{today}"'.format(sequence = sequence, today = datetime.today().strftime("%Y-%m-%d"))
+            if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            # Responses are cached as long as the data has not changed
+            cache_key = (self.path, etag)
+            body = self.server.response_cache.get(cache_key)
+            if body is None:
+                try:
+                    data = self.create_response_data(backend, path_parts, parse_qs(url.query))
+                except LookupError as error:
+                    self.send_json(404, {"error": str(error)})
+                    return
+                except ValueError as error:
+                    self.send_json(400, {"error": str(error)})
+                    return
+                body = json.dumps(data).encode("utf-8")
+                # Changes committed while the body was built may be part of it, so it
+                # is neither cached nor sent with the ETag of the older data
+                if get_last_change_sequence(backend.table_name, backend.connection) == sequence:
+                    self.server.store_response(cache_key, body)
+                else:
+                    etag = None
+
+        self.send_json(200, body, etag)
+
+    def create_response_data(self, backend, path_parts, query):
+        """
+        Retrieves the data of a request from the backend.
+
+        Raises:
+        - LookupError: If the path or the habit does not exist.
+        - ValueError: If a query parameter is invalid.
+        """
+        if path_parts == ["habits"]:
+            return [{"habit_name": habit_name,
+                     "habit_task_specification": backend.get_habit_task_specification(habit_name),
+                     "habit_periodicity": backend.get_habit_periodicity(habit_name)}
+                    for habit_name in backend.get_all_habit_names()]
+
+        if path_parts == ["overview"]:
+            periodicity_choice = query.get("periodicity", ["all"])[0]
+            if periodicity_choice != "all" and periodicity_choice not in backend.get_all_habit_periodicities():
+                raise ValueError("No habits with the periodicity \"{periodicity}\".".format(periodicity = periodicity_choice))
+            return [dict(zip(OVERVIEW_COLUMNS, row)) for row in create_overview_rows(periodicity_choice, backend = backend)]
+
+        if len(path_parts) == 3 and path_parts[0] == "habits" and path_parts[2] in ["completions", "streaks"]:
+            habit_name = path_parts[1]
+            if habit_name not in backend.get_all_habit_names():
+                raise LookupError("The habit \"{habit_name}\" does not exist.".format(habit_name = habit_name))
+            if path_parts[2] == "completions":
+                return [date_completed.strftime("%Y-%m-%d") for date_completed in backend.get_dates_completed(habit_name, include_archived = True)]
+            current_streak, longest_streak = determine_streaks(habit_name, backend = backend)
+            return {"habit_name": habit_name,
+                    "completed": determine_completion(habit_name, backend = backend),
+                    "current_streak": current_streak,
+                    "longest_streak": longest_streak}
+
+        raise LookupError("Not found: /{path}".format(path = "/".join(path_parts)))
+
+    def send_json(self, status, data, etag = None):
+        """
+        Sends a JSON response. Data that is already encoded is sent as it is.
+        """
+        body = data if isinstance(data, bytes) else json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Requests are not logged, like the rest of the habit tracker
+        pass
+
+
+class HabitServer(ThreadingHTTPServer):
+    """
+    Serves the habit data over HTTP, handling every request in its own thread.
+
+    Parameters:
+    - server_address (tuple of (str, int)): The host and port to listen on.
+    - database_file (str): The database file to serve.
+    - table_name (str): The name of the table where habit data is stored. Defaults to "habits".
+    - pool_size (int): The number of database connections. Defaults to 4.
+    - cache_size (int): The maximum number of cached responses. Defaults to 128.
+    """
+    daemon_threads = True
+
+    def __init__(self, server_address, database_file, table_name = "habits", pool_size = 4, cache_size = 128):
+        self.pool = ConnectionPool(database_file, pool_size, table_name)
+        self.cache_size = cache_size
+        self.response_cache = {}
+        self._cache_lock = threading.Lock()
+        super().__init__(server_address, HabitRequestHandler)
+
+    def store_response(self, cache_key, body):
+        """
+        Caches the body of a response, dropping the oldest responses when the cache is full.
+        """
+        with self._cache_lock:
+            self.response_cache[cache_key] = body
+            while len(self.response_cache) > self.cache_size:
+                del self.response_cache[next(iter(self.response_cache))]
+
+    def server_close(self):
+        super().server_close()
+        self.pool.close()
+
+
+def create_server(host = "127.0.0.1", port = 8000, database_file = DATABASE_FILE, table_name = "habits", pool_size = 4):
+    """
+    Creates a local HTTP server for the habit data, see HabitRequestHandler.
+
+    Parameters:
+    - host (str): The host to listen on. Defaults to "127.0.0.1", so only local
+      clients can connect.
+    - port (int): The port to listen on, or 0 for any free port. Defaults to 8000.
+    - database_file (str): The database file to serve. Defaults to the database
+      module's database file.
+    - table_name (str): The name of the table where habit data is stored. Defaults to "habits".
+    - pool_size (int): The number of database connections. Defaults to 4.
+
+    Returns:
+    - server (HabitServer): The server, which starts handling requests once
+      serve_forever() is called.
+    """
+    return HabitServer((host, port), database_file, table_name, pool_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Serves the habit data as JSON over a local HTTP API.")
+    parser.add_argument("--host", default = "127.0.0.1", help = "host to listen on")
+    parser.add_argument("--port", type = int, default = 8000, help = "port to listen on")
+    parser.add_argument("--database", default = DATABASE_FILE, help = "database file to serve")
+    parser.add_argument("--table", default = "habits", help = "name of the habits table")
+    parser.add_argument("--connections", type = int, default = 4, help = "number of database connections")
+    arguments = parser.parse_args()
+
+    server = create_server(arguments.host, arguments.port, arguments.database, arguments.table, arguments.connections)
+    print("Serving habits on http://{host}:{port}/habits".format(host = arguments.host, port = server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
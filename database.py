@@ -1,38 +1,148 @@
 import sqlite3
+import atexit
+import os
+import uuid
+import threading
+import contextlib
 import datetime
 from datetime import datetime
-from model import Habit
+from concurrent.futures import ThreadPoolExecutor
+from model import (
+  Habit,
+  parse_periodicity
+)
+
+# The database file can be changed with the HABITS_DATABASE environment variable
+DATABASE_FILE = os.environ.get('HABITS_DATABASE', 'habits.db')
 
 # Connect to the SQLite database file 'habits.db'
-conn = sqlite3.connect('habits.db')
+conn = sqlite3.connect(DATABASE_FILE)
+
+# In write-ahead log mode, readers such as backups do not block writers and vice versa
+conn.execute('PRAGMA journal_mode=WAL')
 
 # Create a cursor object to execute SQL commands
 c = conn.cursor()
 
-def create_table(table_name = "habits"):
+# Optional write-behind buffer for completions, see enable_completion_buffer()
+_completion_buffer = None
+
+# Number of writes through this module, see get_data_version()
+_local_changes = 0
+
+def get_data_version(connection = None):
+  """
+  Returns a value that changes whenever the habit data may have changed.
+
+  The version combines SQLite's data_version, which changes when another 
+  connection commits to the database, with a counter of the writes made through 
+  this module, including completions queued in the completion buffer. It is 
+  meant to be used as a cache key and has no meaning beyond equality.
+
+  Parameters:
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  - data_version (tuple of int): The current data version.
+  """
+  cursor = _cursor(connection)
+  cursor.execute('PRAGMA data_version')
+  return (cursor.fetchone()[0], _local_changes)
+
+
+def _cursor(connection = None):
+  """
+  Returns the module's cursor, or a new cursor of the given connection.
+  """
+  if connection is None:
+    return c
+  return connection.cursor()
+
+
+def _mark_changed():
+  """
+  Records a write through this module, see get_data_version().
+  """
+  global _local_changes
+  _local_changes += 1
+
+
+def create_table(table_name = "habits", connection = None):
   """
   Creates a table in the database for storing habits.
 
   This function creates a table with the specified name in the database to store 
   habit details if it does not already exist. The table includes columns for the 
-  habit name, task specification, periodicity, date added, and date completed.
+  habit name, task specification, periodicity, date added, and date completed, 
+  together with an index on the habit name. A second table with the suffix 
+  '_archive' stores compacted completion history, a third table with the 
+  suffix '_changes' logs every change of the habit data and a fourth table with 
+  the suffix '_node_id' stores the random id of this node for synchronization.
 
   Parameters:
   - table_name (str): The name of the table to be created. Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
 
   Returns:
   None
   """
-  c.execute(f"""CREATE TABLE IF NOT EXISTS {table_name} (
+  cursor = _cursor(connection)
+  cursor.execute(f"""CREATE TABLE IF NOT EXISTS {table_name} (
             habit_name,
             habit_task_specification,
             habit_periodicity,
             date_added,
             date_completed
             )""")
+  # Almost every query looks up entries by habit name
+  cursor.execute(f'CREATE INDEX IF NOT EXISTS {table_name}_habit_name ON {table_name} (habit_name, date_completed)')
+  # Archived completions are stored as runs of consecutive days, see compact_completions()
+  cursor.execute(f"""CREATE TABLE IF NOT EXISTS {table_name}_archive (
+            habit_name,
+            start_date,
+            end_date
+            )""")
+  # Every change of the habit data is logged for synchronization, see get_changes_since()
+  cursor.execute(f"""CREATE TABLE IF NOT EXISTS {table_name}_changes (
+            sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation,
+            habit_name,
+            habit_task_specification,
+            habit_periodicity,
+            date_added,
+            date_completed,
+            origin_node,
+            origin_sequence
+            )""")
+  # Changes received from other nodes are looked up by their origin, see apply_changes()
+  cursor.execute(f'CREATE INDEX IF NOT EXISTS {table_name}_changes_origin ON {table_name}_changes (origin_node, origin_sequence)')
+  cursor.execute(f'CREATE TABLE IF NOT EXISTS {table_name}_node_id (node_id)')
+  with cursor.connection:
+    cursor.execute(f'INSERT INTO {table_name}_node_id SELECT ? WHERE NOT EXISTS (SELECT 1 FROM {table_name}_node_id)', 
+                   (uuid.uuid4().hex,))
 
 
-def insert_habit(habit: Habit,table_name = "habits"):
+def get_node_id(table_name = "habits", connection = None):
+  """
+  Returns the random id of this node, which identifies the changes made here.
+
+  Parameters:
+  - table_name (str): The name of the table whose node id is returned. 
+    Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  - node_id (str): The id of this node.
+  """
+  cursor = _cursor(connection)
+  cursor.execute(f'SELECT node_id FROM {table_name}_node_id')
+  return cursor.fetchone()[0]
+
+
+def insert_habit(habit: Habit,table_name = "habits", connection = None):
   """
   Inserts a habit into the database.
 
@@ -43,17 +153,29 @@ def insert_habit(habit: Habit,table_name = "habits"):
   - habit (Habit): An instance of the Habit class containing the habit details.
   - table_name (str): The name of the table where the habit will be inserted. 
     Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
 
   Returns:
   None
   """
-  with conn:
-    c.execute(f'INSERT INTO {table_name} VALUES (:habit_name, :habit_task_specification, :habit_periodicity, :date_added, :date_completed)', 
-              {'habit_name': habit.habit_name, 'habit_task_specification': habit.habit_task_specification, 'habit_periodicity':habit.habit_periodicity,
-                'date_added': habit.date_added, 'date_completed': habit.date_completed})
+  cursor = _cursor(connection)
+  with cursor.connection:
+    _insert_habit(cursor, table_name, habit)
+    _log_change(cursor, table_name, "insert_habit", habit.habit_name, habit.date_completed, habit)
+  _mark_changed()
+
+
+def _insert_habit(cursor, table_name, habit):
+  """
+  Inserts a habit within the transaction of the given cursor, without logging it.
+  """
+  cursor.execute(f'INSERT INTO {table_name} VALUES (:habit_name, :habit_task_specification, :habit_periodicity, :date_added, :date_completed)', 
+            {'habit_name': habit.habit_name, 'habit_task_specification': habit.habit_task_specification, 'habit_periodicity':habit.habit_periodicity,
+              'date_added': habit.date_added, 'date_completed': habit.date_completed})
       
 
-def get_all_habit_names(table_name = "habits"):
+def get_all_habit_names(table_name = "habits", connection = None):
   """
   Retrieves all unique habit names from the database.
 
@@ -63,20 +185,23 @@ def get_all_habit_names(table_name = "habits"):
   Parameters:
   - table_name (str): The name of the table from which to retrieve habit names. 
     Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
 
   Returns:
   - all_habits (list of str): A list of unique habit names.
   """
-  with conn:
-    c.execute(f'SELECT DISTINCT habit_name FROM {table_name}')
-    habits = c.fetchall()
+  cursor = _cursor(connection)
+  with cursor.connection:
+    cursor.execute(f'SELECT DISTINCT habit_name FROM {table_name}')
+    habits = cursor.fetchall()
     all_habits = []
     for habit in habits:
         all_habits.append(habit[0])
     return all_habits
 
 
-def get_habit_names_daily(table_name = "habits"):
+def get_habit_names_daily(table_name = "habits", connection = None):
   """
   Retrieves all unique habit names with daily periodicity from the database.
 
@@ -87,20 +212,23 @@ def get_habit_names_daily(table_name = "habits"):
   Parameters:
   - table_name (str): The name of the table from which to retrieve habit names. 
     Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
 
   Returns:
   - daily_habits (list of str): A list of unique habit names with daily periodicity.
   """
-  with conn:
-    c.execute(f'SELECT DISTINCT habit_name FROM {table_name} WHERE habit_periodicity = \'daily\'')
-    habits = c.fetchall()
+  cursor = _cursor(connection)
+  with cursor.connection:
+    cursor.execute(f'SELECT DISTINCT habit_name FROM {table_name} WHERE habit_periodicity = \'daily\'')
+    habits = cursor.fetchall()
     daily_habits = []
     for habit in habits:
         daily_habits.append(habit[0])
     return daily_habits
 
 
-def get_habit_names_weekly(table_name = "habits"):
+def get_habit_names_weekly(table_name = "habits", connection = None):
   """
   Retrieves all unique habit names with weekly periodicity from the database.
 
@@ -111,20 +239,74 @@ def get_habit_names_weekly(table_name = "habits"):
   Parameters:
   - table_name (str): The name of the table from which to retrieve habit names. 
     Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
 
   Returns:
   - weekly_habits (list of str): A list of unique habit names with weekly periodicity.
   """
-  with conn:
-    c.execute(f'SELECT DISTINCT habit_name FROM {table_name} WHERE habit_periodicity = \'weekly\'')
-    habits = c.fetchall()
+  cursor = _cursor(connection)
+  with cursor.connection:
+    cursor.execute(f'SELECT DISTINCT habit_name FROM {table_name} WHERE habit_periodicity = \'weekly\'')
+    habits = cursor.fetchall()
     weekly_habits = []
     for habit in habits:
         weekly_habits.append(habit[0])
     return weekly_habits
 
 
-def complete_habit(habit_name, date_completed, table_name = "habits"):
+def get_habit_names_by_periodicity(habit_periodicity, table_name = "habits", connection = None):
+  """
+  Retrieves all unique habit names with a given periodicity from the database.
+
+  This function queries the specified table in the database to retrieve all 
+  unique habit names that have the given periodicity (e.g., 'monthly' or 
+  '3 times per week'). It returns a list of these habit names.
+
+  Parameters:
+  - habit_periodicity (str): The periodicity of the habits to retrieve.
+  - table_name (str): The name of the table from which to retrieve habit names. 
+    Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  - habit_names (list of str): A list of unique habit names with the given periodicity.
+  """
+  cursor = _cursor(connection)
+  with cursor.connection:
+    cursor.execute(f'SELECT DISTINCT habit_name FROM {table_name} WHERE habit_periodicity = ?', (habit_periodicity,))
+    habits = cursor.fetchall()
+    habit_names = []
+    for habit in habits:
+        habit_names.append(habit[0])
+    return habit_names
+
+
+def get_all_habit_periodicities(table_name = "habits", connection = None):
+  """
+  Retrieves all periodicities that are in use from the database.
+
+  Parameters:
+  - table_name (str): The name of the table from which to retrieve the periodicities. 
+    Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  - all_periodicities (list of str): A sorted list of unique habit periodicities.
+  """
+  cursor = _cursor(connection)
+  with cursor.connection:
+    cursor.execute(f'SELECT DISTINCT habit_periodicity FROM {table_name} ORDER BY habit_periodicity')
+    periodicities = cursor.fetchall()
+    all_periodicities = []
+    for periodicity in periodicities:
+        all_periodicities.append(periodicity[0])
+    return all_periodicities
+
+
+def complete_habit(habit_name, date_completed, table_name = "habits", connection = None):
   """
   Marks a habit as completed by updating the date completed.
 
@@ -132,18 +314,51 @@ def complete_habit(habit_name, date_completed, table_name = "habits"):
   with the provided completion date for the habit. It selects the habit based on its name
   and creates a duplicate of the habit's first entry, where date_completed equals NULL.
   Instead of NULL, the completion date is provided as input for the new entry.
+  Dates that are already part of the archived history are not stored again.
+  If the completion buffer is enabled, the completion is queued instead and 
+  written with the next flush.
 
   Parameters:
   - habit_name (str): The name of the habit to be marked as completed.
   - date_completed (str): The date when the habit was completed, in the format 'YYYY-MM-DD'.
   - table_name (str): The name of the table where the habit is stored. 
     Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
 
   Returns:
   None
   """
-  with conn:
-    c.execute(f"""INSERT INTO {table_name} (
+  _mark_changed()
+  if connection is None and _completion_buffer is not None:
+    _completion_buffer.add(habit_name, date_completed, table_name)
+    return
+  cursor = _cursor(connection)
+  with cursor.connection:
+    # Completions of unknown habits insert nothing and are not logged
+    if _complete_habit(cursor, table_name, habit_name, date_completed):
+      _log_change(cursor, table_name, "complete_habit", habit_name, date_completed)
+
+
+def _complete_habit(cursor, table_name, habit_name, date_completed):
+  """
+  Completes a habit within the transaction of the given cursor, without logging it.
+  Returns whether a completion was inserted.
+  """
+  # Dates that have already been archived are not stored a second time
+  cursor.execute(f'SELECT 1 FROM {table_name}_archive WHERE habit_name = ? AND start_date <= ? AND end_date >= ?', 
+                 (habit_name, date_completed, date_completed))
+  if cursor.fetchone() is not None:
+    return False
+  cursor.execute(_complete_habit_sql(table_name), (date_completed, habit_name))
+  return cursor.rowcount > 0
+
+
+def _complete_habit_sql(table_name):
+  """
+  Returns the statement that copies a habit's first entry with a new completion date.
+  """
+  return f"""INSERT INTO {table_name} (
             habit_name,
             habit_task_specification,
             habit_periodicity,
@@ -158,41 +373,300 @@ def complete_habit(habit_name, date_completed, table_name = "habits"):
             ? as date_completed
             FROM {table_name}
             WHERE
-            habit_name = ? AND date_completed IS NULL""", (date_completed, habit_name))
+            habit_name = ? AND date_completed IS NULL"""
+
+
+def _log_change(cursor, table_name, operation, habit_name, date_completed = None, habit = None, origin = None):
+  """
+  Appends a change of the habit data to the change log of the table.
+
+  This function has to be called within the transaction that makes the change, 
+  so that the data and the change log stay consistent. Changes made on this node 
+  are logged without an origin, changes received from another node keep the node 
+  and sequence number they were originally logged with.
+
+  Parameters:
+  - cursor (sqlite3.Cursor): The cursor of the transaction making the change.
+  - table_name (str): The name of the table that is changed.
+  - operation (str): The name of the database function making the change.
+  - habit_name (str): The name of the changed habit.
+  - date_completed (str or None): The affected completion date, if any. Defaults to None.
+  - habit (Habit or None): The inserted habit, if any. Defaults to None.
+  - origin (tuple of (str, int) or None): The origin node and origin sequence number 
+    of a change received from another node. Defaults to None.
+
+  Returns:
+  None
+  """
+  origin_node, origin_sequence = origin or (None, None)
+  cursor.execute(f"""INSERT INTO {table_name}_changes (
+            operation,
+            habit_name,
+            habit_task_specification,
+            habit_periodicity,
+            date_added,
+            date_completed,
+            origin_node,
+            origin_sequence
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", 
+            (operation, habit_name, habit and habit.habit_task_specification, habit and habit.habit_periodicity, 
+             habit and habit.date_added, date_completed, origin_node, origin_sequence))
 
 
-def get_dates_completed(habit_name, table_name = "habits"):
+def _log_completions(cursor, table_name, habit_name, dates_completed):
+  """
+  Appends the completions of a habit to the change log with a single statement, 
+  like one call of _log_change() per completion date.
+  """
+  cursor.executemany(f'INSERT INTO {table_name}_changes (operation, habit_name, date_completed) VALUES (?, ?, ?)', 
+                     [("complete_habit", habit_name, date_completed) for date_completed in dates_completed])
+
+
+def get_dates_completed(habit_name, table_name = "habits", include_archived = False, connection = None):
   """
   Retrieves and sorts the completion dates of a habit.
 
   This function queries the specified table in the database to retrieve all 
   completion dates for a given habit name where the completion date is not NULL. 
   It converts these dates to datetime objects, sorts them in ascending order 
-  based on the ISO calendar week, and returns the sorted list.
+  based on the ISO calendar week, and returns the sorted list. Completions that 
+  are still queued in the completion buffer are included. Completions moved to 
+  the archive by compact_completions() are only included if requested.
 
   Parameters:
   - habit_name (str): The name of the habit for which to retrieve completion dates.
   - table_name (str): The name of the table from which to retrieve the completion dates. 
     Defaults to "habits".
+  - include_archived (bool): Whether to merge in the archived completion history. 
+    Defaults to False.
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
 
   Returns:
   - all_dates_completed_sorted (list of datetime): A list of completion dates 
     sorted in ascending order based on the ISO calendar week.
   """
-  with conn:
-    c.execute(f'SELECT date_completed FROM {table_name} WHERE habit_name = ? AND date_completed IS NOT NULL', (habit_name,))
-    dates_completed = c.fetchall()
+  completion_buffer = _completion_buffer if connection is None else None
+  cursor = _cursor(connection)
+  # Hold the buffer's lock, so that a flush cannot move completions between the two reads
+  with cursor.connection, (completion_buffer.lock if completion_buffer is not None else contextlib.nullcontext()):
+    cursor.execute(f'SELECT date_completed FROM {table_name} WHERE habit_name = ? AND date_completed IS NOT NULL', (habit_name,))
+    dates_completed = cursor.fetchall()
     all_dates_completed = []
     for date_completed in dates_completed:
         all_dates_completed.append(date_completed[0])
+    if completion_buffer is not None:
+        all_dates_completed.extend(completion_buffer.pending_dates(habit_name, table_name))
     # Convert strings to datetime objects to facilitate sorting
     all_dates_completed = [datetime.strptime(date_completed, "%Y-%m-%d") for date_completed in all_dates_completed]
+    if include_archived:
+        # Expand every archived run of consecutive days into its single days
+        for start_day, end_day in get_archived_segments(habit_name, table_name, connection):
+            all_dates_completed.extend(datetime.fromordinal(day) for day in range(start_day, end_day + 1))
     # Sort the completion dates in ascending order based on the ISO calendar week
     all_dates_completed_sorted = sorted(all_dates_completed, key = lambda x: x.isocalendar())
     return all_dates_completed_sorted
 
 
-def get_habit_periodicity(habit_name, table_name = "habits"):
+def get_all_dates_completed(table_name = "habits", connection = None):
+  """
+  Retrieves the periodicity, date added and completion dates of all habits in one query.
+
+  Like get_dates_completed(), this function only returns the completions in the 
+  habits table, not the archived ones. Buffered completions are flushed first.
+
+  Parameters:
+  - table_name (str): The name of the table from which to retrieve the completion dates. 
+    Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  - all_dates_completed (dict): Maps every habit name to a tuple of its periodicity, 
+    the date when it was added and its completion dates, as a list of datetime 
+    sorted in ascending order.
+  """
+  if connection is None:
+    flush_completion_buffer()
+  cursor = _cursor(connection)
+  with cursor.connection:
+    cursor.execute(f"""SELECT habit.habit_name, habit.habit_periodicity, habit.date_added, completion.date_completed
+              FROM {table_name} AS habit
+              LEFT JOIN {table_name} AS completion
+              ON completion.habit_name = habit.habit_name AND completion.date_completed IS NOT NULL
+              WHERE habit.date_completed IS NULL
+              ORDER BY habit.habit_name, completion.date_completed""")
+    all_dates_completed = {}
+    for habit_name, habit_periodicity, date_added, date_completed in cursor.fetchall():
+        dates_completed = all_dates_completed.setdefault(habit_name, (habit_periodicity, date_added, []))[2]
+        if date_completed is not None:
+            dates_completed.append(datetime.strptime(date_completed, "%Y-%m-%d"))
+    return all_dates_completed
+
+
+def iterate_completion_history(table_name = "habits", connection = None):
+  """
+  Streams the full completion history of all habits, ordered by habit and date.
+
+  This function yields one row per completion in the habits table and one row per 
+  archived run of consecutive days, joined with the details of the habit. Habits 
+  without completions yield a single row without dates. The rows are read from the 
+  cursor one by one, so memory use does not depend on the length of the history.
+
+  Parameters:
+  - table_name (str): The name of the table from which to retrieve the history. 
+    Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Yields:
+  - (str, str, str, str or None, str or None): The habit name, periodicity and date 
+    added, and the first and last day of the completion or archived run, in the 
+    format 'YYYY-MM-DD'.
+  """
+  if connection is None:
+    flush_completion_buffer()
+  # A separate cursor, so that other queries do not interrupt the stream
+  cursor = (connection or conn).cursor()
+  cursor.execute(f"""SELECT habit.habit_name, habit.habit_periodicity, habit.date_added, history.start_date, history.end_date
+            FROM {table_name} AS habit
+            LEFT JOIN (
+              SELECT habit_name, date_completed AS start_date, date_completed AS end_date
+              FROM {table_name} WHERE date_completed IS NOT NULL
+              UNION ALL
+              SELECT habit_name, start_date, end_date FROM {table_name}_archive
+            ) AS history
+            ON history.habit_name = habit.habit_name
+            WHERE habit.date_completed IS NULL
+            ORDER BY habit.habit_name, history.start_date""")
+  try:
+    yield from cursor
+  finally:
+    cursor.close()
+
+
+def get_archived_segments(habit_name, table_name = "habits", connection = None):
+  """
+  Retrieves the archived completion history of a habit.
+
+  Parameters:
+  - habit_name (str): The name of the habit for which to retrieve the archived history.
+  - table_name (str): The name of the table whose archive is queried. 
+    Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  - archived_segments (list of (int, int)): The runs of consecutive completion days 
+    as (first day, last day) ordinals, sorted in ascending order.
+  """
+  cursor = _cursor(connection)
+  with cursor.connection:
+    cursor.execute(f'SELECT start_date, end_date FROM {table_name}_archive WHERE habit_name = ? ORDER BY start_date', (habit_name,))
+    return [(_day_of(start_date), _day_of(end_date)) for start_date, end_date in cursor.fetchall()]
+
+
+def get_completion_segments(habit_name, table_name = "habits", connection = None):
+  """
+  Retrieves the full completion history of a habit as runs of consecutive days.
+
+  Completions in the habits table, buffered completions and archived runs are 
+  merged into runs of consecutive completion days. Unlike 
+  get_dates_completed(include_archived = True), archived runs are not expanded 
+  into single days, so the result grows with the number of runs, not with the 
+  number of completion days.
+
+  Parameters:
+  - habit_name (str): The name of the habit for which to retrieve the history.
+  - table_name (str): The name of the table from which to retrieve the history. 
+    Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  - completion_segments (list of (int, int)): The runs of consecutive completion days 
+    as (first day, last day) ordinals, sorted in ascending order. Runs neither 
+    overlap nor touch each other.
+  """
+  recent_days = {date_completed.toordinal() for date_completed in get_dates_completed(habit_name, table_name, connection = connection)}
+  segments = get_archived_segments(habit_name, table_name, connection) + [(day, day) for day in recent_days]
+  return _merge_segments(segments)
+
+
+def _merge_segments(segments):
+  """
+  Sorts runs of days and merges the ones that overlap or touch each other.
+  """
+  merged_segments = []
+  for start_day, end_day in sorted(segments):
+    if merged_segments and start_day <= merged_segments[-1][1] + 1:
+      merged_segments[-1] = (merged_segments[-1][0], max(merged_segments[-1][1], end_day))
+    else:
+      merged_segments.append((start_day, end_day))
+  return merged_segments
+
+def get_all_completion_segments(first_date, last_date, table_name = "habits", connection = None):
+  """
+  Retrieves the completions of all habits within a date range in one query.
+
+  Completions in the habits table and archived runs of consecutive days are read 
+  together, and archived runs are clipped to the date range. Buffered completions 
+  are flushed first.
+
+  Parameters:
+  - first_date (str): The first date of the range, in the format 'YYYY-MM-DD'.
+  - last_date (str): The last date of the range, in the format 'YYYY-MM-DD'.
+  - table_name (str): The name of the table from which to retrieve the completions. 
+    Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  - all_completion_segments (dict): Maps every habit name, in alphabetical order, to 
+    a list of (first day, last day) ordinals of its completions within the range. 
+    Single completions are runs of one day.
+  """
+  if connection is None:
+    flush_completion_buffer()
+  cursor = _cursor(connection)
+  with cursor.connection:
+    cursor.execute(f"""SELECT habit.habit_name, history.start_date, history.end_date
+              FROM {table_name} AS habit
+              LEFT JOIN (
+                SELECT habit_name, date_completed AS start_date, date_completed AS end_date
+                FROM {table_name} WHERE date_completed BETWEEN :first_date AND :last_date
+                UNION ALL
+                SELECT habit_name, MAX(start_date, :first_date), MIN(end_date, :last_date)
+                FROM {table_name}_archive WHERE end_date >= :first_date AND start_date <= :last_date
+              ) AS history
+              ON history.habit_name = habit.habit_name
+              WHERE habit.date_completed IS NULL
+              ORDER BY habit.habit_name""", {"first_date": first_date, "last_date": last_date})
+    all_completion_segments = {}
+    for habit_name, start_date, end_date in cursor.fetchall():
+        completion_segments = all_completion_segments.setdefault(habit_name, [])
+        if start_date is not None:
+            start_day = _day_of(start_date)
+            # Most rows are single completions, whose date only needs to be parsed once
+            completion_segments.append((start_day, start_day if end_date == start_date else _day_of(end_date)))
+    return all_completion_segments
+
+def _day_of(date_string):
+  """
+  Returns the day ordinal of a date in the format 'YYYY-MM-DD'.
+  """
+  # fromisoformat() is many times faster than strptime(), which matters for a year of history
+  return datetime.fromisoformat(date_string).toordinal()
+
+
+def _date_of(day):
+  """
+  Returns the date of a day ordinal in the format 'YYYY-MM-DD'.
+  """
+  return datetime.fromordinal(day).strftime("%Y-%m-%d")
+
+
+def get_habit_periodicity(habit_name, table_name = "habits", connection = None):
   """
   Retrieves the periodicity of a habit.
 
@@ -204,17 +678,41 @@ def get_habit_periodicity(habit_name, table_name = "habits"):
   - habit_name (str): The name of the habit for which to retrieve the periodicity.
   - table_name (str): The name of the table from which to retrieve the periodicity. 
     Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
 
   Returns:
-  - habit_periodicity (str): The periodicity of the habit (e.g., 'daily' or 'weekly').
+  - habit_periodicity (str): The periodicity of the habit (e.g., 'daily', 'weekly' or 'monthly').
   """
-  with conn:
-    c.execute(f'SELECT habit_periodicity FROM {table_name} WHERE habit_name = ? AND date_completed IS NULL', (habit_name,))
-    habit_periodicity = c.fetchall()
+  cursor = _cursor(connection)
+  with cursor.connection:
+    cursor.execute(f'SELECT habit_periodicity FROM {table_name} WHERE habit_name = ? AND date_completed IS NULL', (habit_name,))
+    habit_periodicity = cursor.fetchall()
     return habit_periodicity[0][0]
 
 
-def get_habit_task_specification(habit_name, table_name = "habits"):
+def get_habit_date_added(habit_name, table_name = "habits", connection = None):
+  """
+  Retrieves the date when a habit was added.
+
+  Parameters:
+  - habit_name (str): The name of the habit for which to retrieve the date.
+  - table_name (str): The name of the table from which to retrieve the date. 
+    Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  - date_added (str): The date when the habit was added, in the format 'YYYY-MM-DD'.
+  """
+  cursor = _cursor(connection)
+  with cursor.connection:
+    cursor.execute(f'SELECT date_added FROM {table_name} WHERE habit_name = ? AND date_completed IS NULL', (habit_name,))
+    date_added = cursor.fetchall()
+    return date_added[0][0]
+
+
+def get_habit_task_specification(habit_name, table_name = "habits", connection = None):
   """
   Retrieves the task specification of a habit.
 
@@ -226,50 +724,595 @@ def get_habit_task_specification(habit_name, table_name = "habits"):
   - habit_name (str): The name of the habit for which to retrieve the task specification.
   - table_name (str): The name of the table from which to retrieve the task specification. 
     Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
 
   Returns:
   - habit_task_specification (str): The task specification of the habit.
   """
-  with conn:
-    c.execute(f'SELECT habit_task_specification FROM {table_name} WHERE habit_name = ? AND date_completed IS NULL', (habit_name,))
-    habit_task_specification = c.fetchall()
+  cursor = _cursor(connection)
+  with cursor.connection:
+    cursor.execute(f'SELECT habit_task_specification FROM {table_name} WHERE habit_name = ? AND date_completed IS NULL', (habit_name,))
+    habit_task_specification = cursor.fetchall()
     return habit_task_specification[0][0]
 
 
-def delete_habit_data(habit_name, table_name = "habits"):
+def delete_habit_data(habit_name, table_name = "habits", connection = None):
   """
   Deletes a habit and its associated data from the database.
 
   This function deletes all entries of a given habit name from the specified 
-  table in the database.
+  table in the database, including its archived completion history.
 
   Parameters:
   - habit_name (str): The name of the habit to be deleted.
   - table_name (str): The name of the table from which to delete the habit data. 
     Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
 
   Returns:
   None
   """
-  with conn:
-    c.execute(f'DELETE FROM {table_name} WHERE habit_name = ?', (habit_name,))
+  _mark_changed()
+  if connection is None and _completion_buffer is not None:
+    _completion_buffer.discard(habit_name, table_name = table_name)
+  cursor = _cursor(connection)
+  with cursor.connection:
+    if _delete_habit_data(cursor, table_name, habit_name):
+      _log_change(cursor, table_name, "delete_habit_data", habit_name)
+
+
+def _delete_habit_data(cursor, table_name, habit_name):
+  """
+  Deletes a habit within the transaction of the given cursor, without logging it.
+  Returns whether the habit existed.
+  """
+  cursor.execute(f'DELETE FROM {table_name} WHERE habit_name = ?', (habit_name,))
+  habit_deleted = cursor.rowcount > 0
+  cursor.execute(f'DELETE FROM {table_name}_archive WHERE habit_name = ?', (habit_name,))
+  return habit_deleted
 
 
-def delete_habit_completion_date(habit_name, habit_completion_date, table_name = "habits"):
+def delete_habit_completion_date(habit_name, habit_completion_date, table_name = "habits", connection = None):
   """
   Deletes a specific completion date of a habit from the database.
 
   This function deletes an entry with a specific completion date for a given 
-  habit name from the specified table in the database.
+  habit name from the specified table in the database. If the date has already 
+  been archived, it is removed from the archived completion history instead.
 
   Parameters:
   - habit_name (str): The name of the habit for which to delete the completion date.
   - habit_completion_date (str): The completion date to be deleted, in the format 'YYYY-MM-DD'.
   - table_name (str): The name of the table from which to delete the habit completion date. 
     Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  None
+  """
+  _mark_changed()
+  if connection is None and _completion_buffer is not None:
+    _completion_buffer.discard(habit_name, habit_completion_date, table_name)
+  cursor = _cursor(connection)
+  with cursor.connection:
+    if _delete_habit_completion_date(cursor, table_name, habit_name, habit_completion_date):
+      _log_change(cursor, table_name, "delete_habit_completion_date", habit_name, habit_completion_date)
+
+
+def _delete_habit_completion_date(cursor, table_name, habit_name, habit_completion_date):
+  """
+  Deletes a completion date within the transaction of the given cursor, without logging it.
+  Returns whether the date was completed.
+  """
+  cursor.execute(f'DELETE FROM {table_name} WHERE habit_name = ? AND date_completed = ?', (habit_name, habit_completion_date))
+  completion_deleted = cursor.rowcount > 0
+  # If the date has already been archived, split the run of days containing it
+  cursor.execute(f'SELECT start_date, end_date FROM {table_name}_archive WHERE habit_name = ? AND start_date <= ? AND end_date >= ?', 
+            (habit_name, habit_completion_date, habit_completion_date))
+  archived_segment = cursor.fetchone()
+  if archived_segment is not None:
+    start_date, end_date = archived_segment
+    completion_day = _day_of(habit_completion_date)
+    remaining_segments = []
+    if start_date < habit_completion_date:
+      remaining_segments.append((habit_name, start_date, _date_of(completion_day - 1)))
+    if habit_completion_date < end_date:
+      remaining_segments.append((habit_name, _date_of(completion_day + 1), end_date))
+    cursor.execute(f'DELETE FROM {table_name}_archive WHERE habit_name = ? AND start_date = ?', (habit_name, start_date))
+    cursor.executemany(f'INSERT INTO {table_name}_archive VALUES (?, ?, ?)', remaining_segments)
+    completion_deleted = True
+  return completion_deleted
+
+
+class CompletionBuffer:
+  """
+  Collects habit completions in memory and writes them to the database in batches.
+
+  Completions are queued per habit, duplicate (habit, date) pairs are dropped, and 
+  all pending completions are written in a single transaction once the buffer holds 
+  max_size entries or its oldest entry is older than max_age seconds. The age is 
+  enforced by a timer thread, so a burst of completions is written within max_age 
+  seconds even if no further completion follows. The buffer therefore writes 
+  through its own connection, which is only used while holding the buffer's lock.
+
+  Attributes:
+  - max_size (int): The number of pending completions that triggers a flush.
+  - max_age (float): The age in seconds of the oldest pending completion that 
+    triggers a flush.
+  - lock (threading.RLock): The lock protecting the queued completions.
+  """
+  def __init__(self, max_size = 500, max_age = 1.0):
+    self.max_size = max_size
+    self.max_age  = max_age
+    self.lock     = threading.RLock()
+    # (table_name, habit_name) -> dict of pending completion dates (used as an ordered set)
+    self._pending = {}
+    self._size    = 0
+    self._timer   = None
+    self._connection = sqlite3.connect(DATABASE_FILE, check_same_thread = False)
+
+  def __len__(self):
+    return self._size
+
+  def add(self, habit_name, date_completed, table_name = "habits"):
+    """
+    Queues a completion and flushes the buffer if it is full.
+
+    The first completion of a batch starts a timer, which flushes the buffer 
+    after max_age seconds. If the flush fails, the error is raised and the new 
+    completion is removed from the buffer again, since the caller learns that it 
+    has not been stored. Completions queued by earlier calls stay in the buffer 
+    and are retried after max_age seconds.
+
+    Parameters:
+    - habit_name (str): The name of the habit to be marked as completed.
+    - date_completed (str): The completion date, in the format 'YYYY-MM-DD'.
+    - table_name (str): The name of the table where the habit is stored. 
+      Defaults to "habits".
+
+    Returns:
+    None
+    """
+    with self.lock:
+      dates = self._pending.setdefault((table_name, habit_name), {})
+      added = date_completed not in dates
+      if added:
+        dates[date_completed] = None
+        self._size += 1
+      if self._timer is None:
+        self._start_timer()
+      if self._size >= self.max_size:
+        try:
+          self.flush()
+        except sqlite3.Error:
+          if added:
+            self.discard(habit_name, date_completed, table_name)
+          raise
+
+  def _start_timer(self):
+    self._timer = threading.Timer(self.max_age, self.flush)
+    # The atexit flush writes the remaining completions, so the timer must not delay the exit
+    self._timer.daemon = True
+    self._timer.start()
+
+  def pending_dates(self, habit_name, table_name = "habits"):
+    """
+    Returns the queued completion dates of a habit as a list of 'YYYY-MM-DD' strings.
+    """
+    with self.lock:
+      return list(self._pending.get((table_name, habit_name), ()))
+
+  def discard(self, habit_name, date_completed = None, table_name = "habits"):
+    """
+    Drops queued completions of a habit, either all of them or a single date.
+    """
+    with self.lock:
+      dates = self._pending.get((table_name, habit_name))
+      if not dates:
+        return
+      if date_completed is None:
+        self._size -= len(dates)
+        del self._pending[(table_name, habit_name)]
+      elif date_completed in dates:
+        del dates[date_completed]
+        self._size -= 1
+        if not dates:
+          del self._pending[(table_name, habit_name)]
+
+  def flush(self):
+    """
+    Writes all queued completions to the database in a single transaction.
+
+    The buffer is only cleared after the transaction has been committed, so 
+    queued completions are kept if the write fails and retried after max_age seconds.
+
+    Returns:
+    None
+    """
+    with self.lock:
+      if self._timer is not None:
+        self._timer.cancel()
+        self._timer = None
+      if self._size:
+        cursor = self._connection.cursor()
+        try:
+          with self._connection:
+            for (table_name, habit_name), dates in self._pending.items():
+              # Look up the habit's first entry once and insert all its completions in one go
+              cursor.execute(f'SELECT habit_name, habit_task_specification, habit_periodicity, date_added FROM {table_name} WHERE habit_name = ? AND date_completed IS NULL', (habit_name,))
+              habit_entries = cursor.fetchall()
+              # Like complete_habit(), leave out dates that are already archived
+              cursor.execute(f'SELECT start_date, end_date FROM {table_name}_archive WHERE habit_name = ? AND end_date >= ? AND start_date <= ?', 
+                             (habit_name, min(dates), max(dates)))
+              archived_segments = cursor.fetchall()
+              dates = [date_completed for date_completed in dates 
+                       if not any(start_date <= date_completed <= end_date for start_date, end_date in archived_segments)]
+              cursor.executemany(f'INSERT INTO {table_name} VALUES (?, ?, ?, ?, ?)', 
+                                 [(*habit_entry, date_completed) for habit_entry in habit_entries for date_completed in dates])
+              if habit_entries:
+                _log_completions(cursor, table_name, habit_name, dates)
+        except sqlite3.Error:
+          self._start_timer()
+          raise
+      self._pending.clear()
+      self._size = 0
+
+  def close(self):
+    """
+    Flushes the buffer and closes its connection.
+
+    Returns:
+    None
+    """
+    with self.lock:
+      self.flush()
+      self._connection.close()
+
+
+def enable_completion_buffer(max_size = 500, max_age = 1.0):
+  """
+  Enables write-behind buffering of habit completions.
+
+  While the buffer is enabled, complete_habit() queues completions in memory instead 
+  of writing each one in its own transaction. Queued completions are visible to 
+  get_dates_completed() and are written when the buffer reaches max_size entries, 
+  at the latest max_age seconds after the oldest entry was queued, when 
+  flush_completion_buffer() or disable_completion_buffer() is called, and at 
+  interpreter shutdown.
+
+  Parameters:
+  - max_size (int): The number of pending completions that triggers a flush. 
+    Defaults to 500.
+  - max_age (float): The age in seconds of the oldest pending completion that 
+    triggers a flush. Defaults to 1.0.
+
+  Returns:
+  None
+  """
+  global _completion_buffer
+  if _completion_buffer is not None:
+    _completion_buffer.close()
+  _completion_buffer = CompletionBuffer(max_size, max_age)
+
+
+def disable_completion_buffer():
+  """
+  Flushes and disables write-behind buffering of habit completions.
 
   Returns:
   None
   """
+  global _completion_buffer
+  if _completion_buffer is not None:
+    _completion_buffer.close()
+  _completion_buffer = None
+
+
+def flush_completion_buffer():
+  """
+  Writes all buffered habit completions to the database, if buffering is enabled.
+
+  Returns:
+  None
+  """
+  if _completion_buffer is not None:
+    _completion_buffer.flush()
+
+
+# Make sure buffered completions are not lost when the application exits
+atexit.register(flush_completion_buffer)
+
+
+def compact_completions(horizon_days = 365, table_name = "habits"):
+  """
+  Moves old completions into the archive as runs of consecutive days.
+
+  This function moves the completions older than horizon_days into the archive 
+  table, where each habit's history is stored as (start_date, end_date) runs of 
+  consecutive completion days. Runs adjacent to already archived runs are merged. 
+  Several completions on the same day are archived as one. Queries for recent data 
+  then only touch the habits table, while get_dates_completed(include_archived = True) 
+  and get_completion_segments() still return the full history.
+
+  Completions of a habit's current and previous period are never archived, no 
+  matter how long its periods are, because determine_completion() only reads the 
+  habits table. The scheduler falls back to the archive for habits whose last 
+  completed period is older.
+
+  Parameters:
+  - horizon_days (int): The age in days from which completions are archived. 
+    Defaults to 365.
+  - table_name (str): The name of the table whose completions are compacted. 
+    Defaults to "habits".
+
+  Returns:
+  - archived_completions (int): The number of completion entries moved to the archive.
+  """
+  flush_completion_buffer()
+  today = datetime.now()
+  horizon_day = today.toordinal() - horizon_days
+  archived_completions = 0
+
   with conn:
-      c.execute(f'DELETE FROM {table_name} WHERE habit_name = ? AND date_completed = ?', (habit_name, habit_completion_date))
\ No newline at end of file
+    c.execute(f'SELECT habit_name, habit_periodicity, date_added FROM {table_name} WHERE date_completed IS NULL')
+    habits = c.fetchall()
+
+    for habit_name, habit_periodicity, date_added in habits:
+      # Keep the current and the previous period of the habit in the habits table
+      periodicity = parse_periodicity(habit_periodicity, date_added)
+      cutoff_date = _date_of(min(horizon_day, periodicity.first_day_of(periodicity.period_of(today) - 1)))
+
+      c.execute(f'SELECT date_completed FROM {table_name} WHERE habit_name = ? AND date_completed IS NOT NULL AND date_completed < ?', 
+                (habit_name, cutoff_date))
+      old_completions = c.fetchall()
+      if not old_completions:
+        continue
+
+      # Combine the single days with the runs that are already archived
+      c.execute(f'SELECT start_date, end_date FROM {table_name}_archive WHERE habit_name = ?', (habit_name,))
+      segments = [(_day_of(start_date), _day_of(end_date)) for start_date, end_date in c.fetchall()]
+      segments.extend((_day_of(date_completed), _day_of(date_completed)) for date_completed, in old_completions)
+
+      c.execute(f'DELETE FROM {table_name}_archive WHERE habit_name = ?', (habit_name,))
+      c.executemany(f'INSERT INTO {table_name}_archive VALUES (?, ?, ?)', 
+                    [(habit_name, _date_of(start_day), _date_of(end_day)) for start_day, end_day in _merge_segments(segments)])
+
+      c.execute(f'DELETE FROM {table_name} WHERE habit_name = ? AND date_completed IS NOT NULL AND date_completed < ?', (habit_name, cutoff_date))
+      archived_completions += len(old_completions)
+
+  return archived_completions
+
+
+def backup_database(backup_path, pages_per_step = 256, progress = None):
+  """
+  Creates an online backup of the database using the SQLite backup API.
+
+  This function copies the database page by page into the given file through a 
+  dedicated connection. The connection holds a read transaction for the whole 
+  copy, so every step reads the same state of the write-ahead log. Other 
+  connections, including this module's one, keep reading and writing meanwhile, 
+  and their commits neither block nor restart the copy. Buffered completions are 
+  flushed before the backup starts.
+
+  Parameters:
+  - backup_path (str): The path of the backup file. An existing file is overwritten.
+  - pages_per_step (int): The number of pages copied per step. Defaults to 256.
+  - progress (callable or None): A function called after every step with the number 
+    of pages copied and the total number of pages. Defaults to None.
+
+  Returns:
+  None
+  """
+  flush_completion_buffer()
+
+  def after_step(status, remaining, total):
+    if progress is not None:
+      progress(total - remaining, total)
+
+  source_conn = sqlite3.connect(DATABASE_FILE, isolation_level = None)
+  backup_conn = sqlite3.connect(backup_path)
+  try:
+    # A read transaction only takes its snapshot with the first read
+    source_conn.execute('BEGIN')
+    source_conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+    source_conn.backup(backup_conn, pages = pages_per_step, progress = after_step)
+  finally:
+    backup_conn.close()
+    source_conn.close()
+
+
+def create_snapshot(backup_directory = "backups", keep = 7, **backup_options):
+  """
+  Creates a timestamped snapshot of the database and removes old snapshots.
+
+  The snapshot is first written to a temporary file and renamed once the backup 
+  is complete, so that the backup directory only ever contains complete snapshots. 
+  The temporary file is removed if the backup fails. Afterwards, only the newest 
+  keep snapshots are retained.
+
+  Parameters:
+  - backup_directory (str): The directory where the snapshots are stored. 
+    Defaults to "backups".
+  - keep (int): The number of snapshots to retain. Defaults to 7.
+  - **backup_options: Further arguments passed on to backup_database().
+
+  Returns:
+  - snapshot_path (str): The path of the created snapshot.
+  """
+  os.makedirs(backup_directory, exist_ok = True)
+  snapshot_name = "habits-{timestamp}.db".format(timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f"))
+  snapshot_path = os.path.join(backup_directory, snapshot_name)
+
+  try:
+    backup_database(snapshot_path + ".part", **backup_options)
+  except BaseException:
+    if os.path.exists(snapshot_path + ".part"):
+      os.remove(snapshot_path + ".part")
+    raise
+  os.replace(snapshot_path + ".part", snapshot_path)
+
+  # Snapshot names sort chronologically, so the oldest ones come first
+  snapshots = sorted(name for name in os.listdir(backup_directory) if name.startswith("habits-") and name.endswith(".db"))
+  for snapshot in snapshots[:max(len(snapshots) - keep, 0)]:
+    os.remove(os.path.join(backup_directory, snapshot))
+
+  return snapshot_path
+
+
+# Snapshots are created one after another in a background thread, see start_snapshot()
+_snapshot_executor = ThreadPoolExecutor(max_workers = 1)
+
+
+def start_snapshot(backup_directory = "backups", keep = 7, **backup_options):
+  """
+  Creates a snapshot in a background thread, see create_snapshot().
+
+  The application keeps running while the snapshot is created. Pending snapshots 
+  are completed before the interpreter exits.
+
+  Parameters:
+  - backup_directory (str): The directory where the snapshots are stored. 
+    Defaults to "backups".
+  - keep (int): The number of snapshots to retain. Defaults to 7.
+  - **backup_options: Further arguments passed on to backup_database(), e.g. a 
+    progress function, which is called in the background thread.
+
+  Returns:
+  - snapshot (concurrent.futures.Future): A future whose result is the path of 
+    the created snapshot.
+  """
+  return _snapshot_executor.submit(create_snapshot, backup_directory, keep, **backup_options)
+
+
+def get_changes_since(sequence = 0, limit = None, table_name = "habits", connection = None):
+  """
+  Retrieves the changes of the habit data after a given sequence number.
+
+  Every insert, completion and deletion is logged with a monotonically increasing 
+  sequence number. Another node can pass the sequence number of the last change 
+  it has received, so that only newer changes are exported. Every change carries 
+  the id of the node it was made on and its sequence number there, so that 
+  apply_changes() can recognize changes it has already seen.
+
+  Parameters:
+  - sequence (int): The sequence number of the last change already known. Defaults to 0.
+  - limit (int or None): The maximum number of changes to return. Defaults to None.
+  - table_name (str): The name of the table whose changes are retrieved. 
+    Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  - changes (list of dict): The changes in ascending order of their sequence number, 
+    each with the keys of the columns of the change log.
+  """
+  flush_completion_buffer()
+  cursor = _cursor(connection)
+  with cursor.connection:
+    # Changes made on this node are logged without an origin
+    cursor.execute(f"""SELECT
+              sequence,
+              operation,
+              habit_name,
+              habit_task_specification,
+              habit_periodicity,
+              date_added,
+              date_completed,
+              COALESCE(origin_node, (SELECT node_id FROM {table_name}_node_id)) AS origin_node,
+              COALESCE(origin_sequence, sequence) AS origin_sequence
+              FROM {table_name}_changes
+              WHERE sequence > ? ORDER BY sequence LIMIT ?""", 
+              (sequence, -1 if limit is None else limit))
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, change)) for change in cursor.fetchall()]
+
+
+def get_last_change_sequence(table_name = "habits", connection = None):
+  """
+  Returns the sequence number of the last logged change of the habit data.
+
+  Unlike get_data_version(), the sequence number is the same for every connection 
+  to the database, so it can identify a state of the data across processes.
+
+  Parameters:
+  - table_name (str): The name of the table whose change log is queried. 
+    Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  - sequence (int): The sequence number of the last change, or 0 if nothing has changed yet.
+  """
+  cursor = _cursor(connection)
+  cursor.execute(f'SELECT MAX(sequence) FROM {table_name}_changes')
+  return cursor.fetchone()[0] or 0
+
+
+def apply_changes(changes, table_name = "habits", connection = None):
+  """
+  Applies changes exported from another node by get_changes_since().
+
+  Every change is identified by the node it was made on and its sequence number 
+  there. Changes made on this node and changes that have already been applied, 
+  e.g. because they arrived through another node before, are skipped. All other 
+  changes are logged with their original origin, even if they leave the data as 
+  it is, so that they are passed on to further nodes but never sent back as new 
+  changes. Applying a change is idempotent: habits that already exist are not 
+  inserted again, completions that are already stored are not completed again, 
+  and deleting missing data does nothing.
+
+  Parameters:
+  - changes (list of dict): The changes to apply, in ascending order of their sequence number.
+  - table_name (str): The name of the table the changes are applied to. 
+    Defaults to "habits".
+  - connection (sqlite3.Connection or None): The connection to use instead of the 
+    module's connection. Defaults to None.
+
+  Returns:
+  - last_sequence (int or None): The sequence number of the last received change, 
+    to be passed to get_changes_since() next time, or None if there were no changes.
+  """
+  flush_completion_buffer()
+  cursor = _cursor(connection)
+  node_id = get_node_id(table_name, connection)
+  last_sequence = None
+
+  with cursor.connection:
+    for change in changes:
+      last_sequence = change["sequence"]
+      operation = change["operation"]
+      habit_name = change["habit_name"]
+      origin = (change["origin_node"], change["origin_sequence"])
+
+      # Changes made on this node come back from the nodes they were sent to
+      if origin[0] == node_id:
+        continue
+      cursor.execute(f'SELECT 1 FROM {table_name}_changes WHERE origin_node = ? AND origin_sequence = ?', origin)
+      if cursor.fetchone() is not None:
+        continue
+
+      habit = None
+      if operation == "insert_habit":
+        habit = Habit(habit_name, change["habit_task_specification"], change["habit_periodicity"], change["date_completed"])
+        habit.date_added = change["date_added"]
+        cursor.execute(f'SELECT 1 FROM {table_name} WHERE habit_name = ? AND date_completed IS NULL', (habit_name,))
+        if cursor.fetchone() is None:
+          _insert_habit(cursor, table_name, habit)
+      elif operation == "complete_habit":
+        # Archived completion dates are checked by _complete_habit()
+        cursor.execute(f'SELECT 1 FROM {table_name} WHERE habit_name = ? AND date_completed = ?', (habit_name, change["date_completed"]))
+        if cursor.fetchone() is None:
+          _complete_habit(cursor, table_name, habit_name, change["date_completed"])
+      elif operation == "delete_habit_data":
+        _delete_habit_data(cursor, table_name, habit_name)
+      elif operation == "delete_habit_completion_date":
+        _delete_habit_completion_date(cursor, table_name, habit_name, change["date_completed"])
+      else:
+        raise ValueError(f"Unknown operation: {operation!r}")
+      _log_change(cursor, table_name, operation, habit_name, change["date_completed"], habit, origin)
+
+  _mark_changed()
+  return last_sequence
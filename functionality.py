@@ -1,6 +1,23 @@
-from model import Habit
+from model import (
+    Habit,
+    parse_periodicity
+)
+from bisect import (
+    bisect_left,
+    insort
+)
+from functools import lru_cache
+from itertools import groupby
+from prompt_toolkit.completion import (
+    Completer,
+    Completion
+)
 from rich.console import Console
 from rich.table import Table
+from rich.text import (
+    Span,
+    Text
+)
 from datetime import (
     datetime,
     timedelta
@@ -9,14 +26,15 @@ from analysis import (
     determine_streaks, 
     determine_completion
 )
+from storage import (
+    SQLiteBackend,
+    ShardedBackend
+)
 from database import (
     insert_habit, 
-    get_habit_periodicity,
-    get_habit_task_specification, 
-    get_all_habit_names, 
-    get_habit_names_daily, 
-    get_habit_names_weekly, 
-    get_dates_completed
+    get_dates_completed,
+    get_data_version,
+    get_all_completion_segments
 )
 
 def add_habit(habit_name, habit_task_specification, habit_periodicity, table_name = "habits"):
@@ -29,13 +47,20 @@ def add_habit(habit_name, habit_task_specification, habit_periodicity, table_nam
     Parameters:
     - habit_name (str): The name of the habit.
     - habit_task_specification (str): The task specification of the habit.
-    - habit_periodicity (str): The periodicity of the habit (e.g., daily, weekly).
+    - habit_periodicity (str): The periodicity of the habit (e.g., daily, weekly, monthly, 
+      every N days or N times per week).
     - table_name (str): The name of the table where the habit is stored. 
       Defaults to "habits".
 
     Returns:
     - None
+
+    Raises:
+    - ValueError: If the periodicity is not supported.
     """
+    # Make sure only periodicities the analysis can handle are stored
+    parse_periodicity(habit_periodicity)
+
     habit = Habit (habit_name = habit_name, 
                    habit_task_specification = habit_task_specification, 
                    habit_periodicity = habit_periodicity)
@@ -107,54 +132,99 @@ def create_list_of_available_completion_dates(habit_name, table_name = "habits")
     return available_dates_list
 
 
-def create_overview_table(periodicity_choice, column_sorted_by, table_name = "habits"):
+def create_overview_rows(periodicity_choice, table_name = "habits", backend = None):
     """
-    Creates an overview table of habits based on specified periodicity and sorting column.
+    Creates the rows of the overview table for habits of the specified periodicity.
 
-    This function generates an overview table displaying habit data such as name, task specification, 
-    periodicity, completion status, current streak, and longest streak. The table is sorted based 
-    on the specified sorting column and filtered by the chosen periodicity.
+    Computed rows are cached. The cache is keyed on the data version of the database 
+    and on the current date, so any write as well as a new day, week or month leads 
+    to a recomputation.
 
     Parameters:
     - periodicity_choice (str): The choice of periodicity for filtering habits.
-      Options: "all" (all habits), "daily" (daily habits), "weekly" (weekly habits).
-    - column_sorted_by (str): The column by which to sort the table.
-      Options: "Current Streak" (sort by current streak), "Longest Streak" (sort by longest streak).
+      Options: "all" (all habits) or any periodicity in use, e.g. "daily" or "weekly".
     - table_name (str): The name of the table where habit data is stored. Defaults to "habits".
+    - backend (StorageBackend or None): The storage backend to retrieve the habit data 
+      from. Defaults to None, which uses the SQLite table given by table_name.
 
     Returns:
-    - None: The overview table is displayed using rich console output.
+    - habits_data (tuple of tuple of str): One row per habit, containing name, task 
+      specification, periodicity, completion status, current streak and longest streak.
     """
+    # The rows of every shard are computed in parallel and then combined
+    if isinstance(backend, ShardedBackend):
+        return tuple(habit_row for shard_rows in backend.map_shards(lambda shard: create_overview_rows(periodicity_choice, backend = shard))
+                     for habit_row in shard_rows)
+
+    data_version = get_data_version() if backend is None else backend.get_data_version()
+    return _compute_overview_rows(periodicity_choice, table_name, backend, data_version, datetime.today().date())
+
+
+@lru_cache(maxsize = 32)
+def _compute_overview_rows(periodicity_choice, table_name, backend, data_version, today):
+    """
+    Computes the rows of the overview table, see create_overview_rows().
+
+    The data_version and today parameters are not used in the computation, 
+    they only serve as part of the cache key.
+    """
+    if backend is None:
+        backend = SQLiteBackend(table_name)
+
     # Initialize an empty list to store habit data
     habits_data = []
 
     # Retrieve habit names based on the specified periodicity choice
     if periodicity_choice == "all":
-        habit_names = get_all_habit_names(table_name)
-    elif periodicity_choice == "daily":
-        habit_names = get_habit_names_daily(table_name)
-    elif periodicity_choice == "weekly":
-        habit_names = get_habit_names_weekly(table_name)
+        habit_names = backend.get_all_habit_names()
+    else:
+        habit_names = backend.get_habit_names_by_periodicity(periodicity_choice)
     
     # Iterate through each habit name
     for habit_name in habit_names:
         # Retrieve habit task specification
-        habit_task_specification = get_habit_task_specification(habit_name, table_name)
+        habit_task_specification = backend.get_habit_task_specification(habit_name)
         
         # Retrieve habit periodicity
-        habit_periodicity = get_habit_periodicity(habit_name, table_name)
+        habit_periodicity = backend.get_habit_periodicity(habit_name)
         
         # Determine whether habit is already completed or not
-        habit_completed = determine_completion(habit_name, table_name)
+        habit_completed = determine_completion(habit_name, backend = backend)
         
         # Determine streaks for the habit
-        streaks = determine_streaks(habit_name, table_name)
+        streaks = determine_streaks(habit_name, backend = backend)
         habit_current_streak = str(streaks[0])
         habit_longest_streak = str(streaks[1])
         
         # Append habit data to the list
-        habit_data = [habit_name, habit_task_specification, habit_periodicity, habit_completed, habit_current_streak, habit_longest_streak]
+        habit_data = (habit_name, habit_task_specification, habit_periodicity, habit_completed, habit_current_streak, habit_longest_streak)
         habits_data.append(habit_data)
+
+    return tuple(habits_data)
+
+
+def create_overview_table(periodicity_choice, column_sorted_by, table_name = "habits", backend = None):
+    """
+    Creates an overview table of habits based on specified periodicity and sorting column.
+
+    This function generates an overview table displaying habit data such as name, task specification, 
+    periodicity, completion status, current streak, and longest streak. The table is sorted based 
+    on the specified sorting column and filtered by the chosen periodicity.
+
+    Parameters:
+    - periodicity_choice (str): The choice of periodicity for filtering habits.
+      Options: "all" (all habits) or any periodicity in use, e.g. "daily" or "weekly".
+    - column_sorted_by (str): The column by which to sort the table.
+      Options: "Current Streak" (sort by current streak), "Longest Streak" (sort by longest streak).
+    - table_name (str): The name of the table where habit data is stored. Defaults to "habits".
+    - backend (StorageBackend or None): The storage backend to retrieve the habit data 
+      from. Defaults to None, which uses the SQLite table given by table_name.
+
+    Returns:
+    - None: The overview table is displayed using rich console output.
+    """
+    # Retrieve the habit data, which is only recomputed if the data or the date has changed
+    habits_data = create_overview_rows(periodicity_choice, table_name, backend)
     
     # Determine the index of the column to sort by
     if column_sorted_by == "Current Streak":
@@ -185,4 +255,263 @@ def create_overview_table(periodicity_choice, column_sorted_by, table_name = "ha
     console.print(table)
 
 
+def create_completion_bitmap(completion_segments, first_day):
+    """
+    Creates a bitmap of the days on which a habit was completed.
+
+    Bit i of the bitmap is set if the habit was completed on day first_day + i. 
+    A run of consecutive days is set with a single operation, so long archived 
+    runs cost no more than single completions.
+
+    Parameters:
+    - completion_segments (list of (int, int)): The runs of completion days as 
+      (first day, last day) ordinals, none of them before first_day.
+    - first_day (int): The day ordinal of bit 0.
+
+    Returns:
+    - completion_bitmap (int): The bitmap of completion days.
+    """
+    completion_bitmap = 0
+    for start_day, end_day in completion_segments:
+        completion_bitmap |= ((1 << (end_day - start_day + 1)) - 1) << (start_day - first_day)
+    return completion_bitmap
+
+
+def create_heatmap(habit_name, completion_bitmap, first_day, last_day):
+    """
+    Creates a calendar heatmap of a habit, with one column per week and one row per weekday.
+
+    Parameters:
+    - habit_name (str): The name of the habit, shown above the heatmap.
+    - completion_bitmap (int): The completion days, see create_completion_bitmap().
+    - first_day (int): The day ordinal of the first day shown.
+    - last_day (int): The day ordinal of the last day shown.
+
+    Returns:
+    - heatmap (Text): The heatmap for rich console output.
+    """
+    # The first column starts on the Monday before the first day
+    grid_start = first_day - datetime.fromordinal(first_day).weekday()
+    weeks = (last_day - grid_start) // 7 + 1
+
+    # The text is joined once from its parts, with a style span for every run of equal cells, 
+    # because appending cell by cell is slow for hundreds of habits
+    parts = [habit_name, " ({completed} of {days} days completed)\n".format(completed = bin(completion_bitmap).count("1"), 
+                                                                          days = last_day - first_day + 1)]
+    spans = [Span(0, len(habit_name), "bold")]
+    length = len(parts[0]) + len(parts[1])
+
+    # Label each column in which a new month starts
+    month_labels = [" "] * (weeks + 3)
+    for week in range(weeks):
+        week_start = max(grid_start + week * 7, first_day)
+        if week_start == first_day or datetime.fromordinal(week_start).day <= 7:
+            label = datetime.fromordinal(week_start).strftime("%b")
+            if all(character == " " for character in month_labels[max(week - 1, 0):week + 3]):
+                month_labels[week:week + 3] = label
+    parts.append("    " + "".join(month_labels).rstrip() + "\n")
+    length += len(parts[-1])
+
+    for weekday, weekday_label in enumerate(["Mon", "", "Wed", "", "Fri", "", "Sun"]):
+        parts.append(weekday_label.ljust(4))
+        length += 4
+        cell_styles = []
+        for week in range(weeks):
+            day = grid_start + week * 7 + weekday
+            if day < first_day or day > last_day:
+                cell_styles.append(None)
+            elif completion_bitmap >> (day - first_day) & 1:
+                cell_styles.append("green")
+            else:
+                cell_styles.append("grey30")
+        # Neighbouring cells of the same style share one span, which keeps rendering fast
+        for style, cells in groupby(cell_styles):
+            cell_count = len(list(cells))
+            if style is None:
+                parts.append(" " * cell_count)
+            else:
+                parts.append("■" * cell_count)
+                spans.append(Span(length, length + cell_count, style))
+            length += cell_count
+        parts.append("\n")
+        length += 1
+
+    return Text("".join(parts), spans = spans)
+
+
+def create_heatmaps(habit_names = None, days = 365, table_name = "habits"):
+    """
+    Creates calendar heatmaps of the completions of several habits over the last days.
+
+    The completions of all habits, including the archived ones, are retrieved with 
+    a single query and stored as one bitmap per habit.
+
+    Parameters:
+    - habit_names (list of str or None): The habits to create heatmaps for. Defaults 
+      to None, which creates heatmaps for all habits.
+    - days (int): The number of days shown, ending today. Defaults to 365.
+    - table_name (str): The name of the table where habit data is stored. Defaults to "habits".
+
+    Returns:
+    - heatmaps (list of Text): The heatmaps, in the order of the habit names.
+    """
+    last_day = datetime.today().toordinal()
+    first_day = last_day - days + 1
+
+    all_completion_segments = get_all_completion_segments(datetime.fromordinal(first_day).strftime("%Y-%m-%d"), 
+                                                          datetime.fromordinal(last_day).strftime("%Y-%m-%d"), table_name)
+    if habit_names is None:
+        habit_names = list(all_completion_segments)
+
+    return [create_heatmap(habit_name, create_completion_bitmap(all_completion_segments.get(habit_name, []), first_day), first_day, last_day)
+            for habit_name in habit_names]
+
+
+def show_heatmaps(habit_names = None, days = 365, table_name = "habits", console = None):
+    """
+    Displays calendar heatmaps of the completions of several habits, see create_heatmaps().
+
+    Parameters:
+    - console (Console or None): The console to display the heatmaps on. Defaults to 
+      None, which creates a console for the terminal.
+
+    Returns:
+    - None: The heatmaps are displayed using rich console output.
+    """
+    console = console or Console()
+    for heatmap in create_heatmaps(habit_names, days, table_name):
+        console.print(heatmap)
+
+
+class HabitNameIndex:
+    """
+    Keeps habit names in memory for fast prefix and fuzzy search.
+
+    The names are kept sorted by their case-folded form, so prefix searches use 
+    binary search and only touch the matching names. For fuzzy search, every name 
+    is also indexed by its characters, so only names containing all characters of 
+    the text have to be checked. The index has to be updated with add() and 
+    remove() whenever a habit is added or deleted.
+
+    Parameters:
+    - habit_names (iterable of str): The names to start the index with.
+    - fuzzy_scan_limit (int): The maximum number of names checked by a fuzzy search.
+      Defaults to 200.
+    """
+    def __init__(self, habit_names = (), fuzzy_scan_limit = 200):
+        self.fuzzy_scan_limit = fuzzy_scan_limit
+        self._entries = sorted((habit_name.casefold(), habit_name) for habit_name in set(habit_names))
+        # Character -> dict of entries containing it (used as an ordered set, so that 
+        # fuzzy search checks the names in a stable order)
+        self._grams = {}
+        for entry in self._entries:
+            for character in set(entry[0]):
+                self._grams.setdefault(character, {})[entry] = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, habit_name):
+        entry = (habit_name.casefold(), habit_name)
+        position = bisect_left(self._entries, entry)
+        return position < len(self._entries) and self._entries[position] == entry
+
+    def add(self, habit_name):
+        """
+        Adds a habit name to the index, unless it is already contained.
+        """
+        if habit_name not in self:
+            entry = (habit_name.casefold(), habit_name)
+            insort(self._entries, entry)
+            for character in set(entry[0]):
+                self._grams.setdefault(character, {})[entry] = None
+
+    def remove(self, habit_name):
+        """
+        Removes a habit name from the index, if it is contained.
+        """
+        if habit_name in self:
+            entry = (habit_name.casefold(), habit_name)
+            del self._entries[bisect_left(self._entries, entry)]
+            for character in set(entry[0]):
+                del self._grams[character][entry]
+                if not self._grams[character]:
+                    del self._grams[character]
+
+    def search_prefix(self, prefix, limit = 10):
+        """
+        Returns up to limit habit names starting with the prefix, ignoring case.
+
+        Parameters:
+        - prefix (str): The beginning of the habit names to search for.
+        - limit (int): The maximum number of names to return. Defaults to 10.
+
+        Returns:
+        - habit_names (list of str): The matching habit names in alphabetical order.
+        """
+        key = prefix.casefold()
+        habit_names = []
+        position = bisect_left(self._entries, (key,))
+        while position < len(self._entries) and len(habit_names) < limit and self._entries[position][0].startswith(key):
+            habit_names.append(self._entries[position][1])
+            position += 1
+        return habit_names
+
+    def search(self, text, limit = 10):
+        """
+        Returns up to limit habit names matching the text, ignoring case.
+
+        Names starting with the text are returned first. If there are fewer than 
+        limit of them, names containing the characters of the text in the same 
+        order (e.g., 'gtb' for 'Go to bed early') are added. Such a name contains 
+        every character of the text, so only the names in the smallest of the 
+        matching index sets are checked, in the order they were indexed, and at 
+        most fuzzy_scan_limit of them.
+
+        Parameters:
+        - text (str): The text typed by the user.
+        - limit (int): The maximum number of names to return. Defaults to 10.
+
+        Returns:
+        - habit_names (list of str): The matching habit names.
+        """
+        habit_names = self.search_prefix(text, limit)
+        key = text.casefold()
+        if not key or len(habit_names) >= limit:
+            return habit_names
+
+        candidate_sets = sorted((self._grams.get(character, {}) for character in set(key)), key = len)
+        fuzzy_entries = []
+        for scanned, entry in enumerate(candidate_sets[0]):
+            if scanned >= self.fuzzy_scan_limit or len(habit_names) + len(fuzzy_entries) >= limit:
+                break
+            if all(entry in candidates for candidates in candidate_sets[1:]) and not entry[0].startswith(key) and _is_subsequence(key, entry[0]):
+                fuzzy_entries.append(entry)
+        return habit_names + [habit_name for _, habit_name in sorted(fuzzy_entries)]
+
+
+def _is_subsequence(text, habit_name):
+    """
+    Returns whether all characters of text appear in habit_name in the same order.
+    """
+    characters = iter(habit_name)
+    return all(character in characters for character in text)
+
+
+class HabitNameCompleter(Completer):
+    """
+    Offers type-ahead completion of habit names from a HabitNameIndex.
+
+    Attributes:
+    - habit_index (HabitNameIndex): The index to search for completions.
+    - limit (int): The maximum number of completions shown at once.
+    """
+    def __init__(self, habit_index, limit = 10):
+        self.habit_index = habit_index
+        self.limit = limit
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor
+        for habit_name in self.habit_index.search(text, self.limit):
+            yield Completion(habit_name, start_position = -len(text))
 
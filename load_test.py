@@ -0,0 +1,298 @@
+import os
+import math
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import multiprocessing
+from contextlib import contextmanager
+from rich.console import Console
+from rich.table import Table
+from datetime import (
+    datetime,
+    timedelta
+)
+
+# Operations simulated by every worker and their relative frequencies
+OPERATION_WEIGHTS = {
+    "add_habit":                    1,
+    "complete_habit":               6,
+    "delete_habit_completion_date": 1,
+    "overview":                     2
+}
+
+
+def percentile(latencies_sorted, percent):
+    """
+    Returns a percentile of sorted latencies using the nearest-rank method.
+
+    Parameters:
+    - latencies_sorted (list of float): The latencies, sorted in ascending order.
+    - percent (float): The percentile to return, between 0 and 100.
+
+    Returns:
+    - latency (float): The latency at the given percentile, or 0.0 if there are none.
+    """
+    if not latencies_sorted:
+        return 0.0
+    rank = max(math.ceil(len(latencies_sorted) * percent / 100), 1)
+    return latencies_sorted[min(rank, len(latencies_sorted)) - 1]
+
+
+def create_tables(table_name):
+    """
+    Creates the habit tables in the database configured through HABITS_DATABASE.
+
+    Parameters:
+    - table_name (str): The name of the table to be created.
+
+    Returns:
+    - None
+    """
+    from database import create_table
+    create_table(table_name)
+
+
+def run_worker(worker_id, operations, table_name, seed):
+    """
+    Simulates one user running a random mix of operations against the database.
+
+    This function runs in its own process and uses the database configured through
+    the HABITS_DATABASE environment variable. Errors caused by a locked database
+    are counted as lock contention instead of being raised.
+
+    Parameters:
+    - worker_id (int): The number of the worker, used to name its habits.
+    - operations (int): The number of operations to run.
+    - table_name (str): The name of the table where habit data is stored.
+    - seed (int): The seed for the random choice of operations.
+
+    Returns:
+    - (dict, dict): A tuple containing:
+      - latencies (dict of str to list of float): The latencies in seconds per operation.
+      - lock_errors (dict of str to int): The number of lock contention errors per operation.
+    """
+    # Imported here, so that the database module connects in the worker process
+    from functionality import (
+        add_habit,
+        create_overview_rows
+    )
+    from database import (
+        complete_habit,
+        delete_habit_completion_date
+    )
+
+    randomizer = random.Random(seed)
+    today = datetime.today()
+    habit_names = []
+    latencies = {operation: [] for operation in OPERATION_WEIGHTS}
+    lock_errors = {operation: 0 for operation in OPERATION_WEIGHTS}
+
+    for _ in range(operations):
+        operation = randomizer.choices(list(OPERATION_WEIGHTS), weights = list(OPERATION_WEIGHTS.values()))[0]
+        # Habits have to exist before they can be completed
+        if not habit_names:
+            operation = "add_habit"
+        random_date = (today - timedelta(days = randomizer.randrange(30))).strftime("%Y-%m-%d")
+
+        start = time.perf_counter()
+        try:
+            if operation == "add_habit":
+                habit_name = "Habit {worker_id}-{number}".format(worker_id = worker_id, number = len(habit_names))
+                add_habit(habit_name, "Load test habit", randomizer.choice(["daily", "weekly"]), table_name)
+                habit_names.append(habit_name)
+            elif operation == "complete_habit":
+                complete_habit(randomizer.choice(habit_names), random_date, table_name)
+            elif operation == "delete_habit_completion_date":
+                delete_habit_completion_date(randomizer.choice(habit_names), random_date, table_name)
+            elif operation == "overview":
+                create_overview_rows("all", table_name)
+        except sqlite3.OperationalError as error:
+            if "locked" not in str(error):
+                raise
+            lock_errors[operation] += 1
+            continue
+        latencies[operation].append(time.perf_counter() - start)
+
+    return latencies, lock_errors
+
+
+@contextmanager
+def use_database_file(database_file = None):
+    """
+    Points HABITS_DATABASE at a database file while worker processes are started.
+
+    If no database file is given, a temporary one is created and removed afterwards.
+
+    Parameters:
+    - database_file (str or None): The database file to use. Defaults to None.
+
+    Returns:
+    - context manager: Yields the path of the database file.
+    """
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        if database_file is None:
+            database_file = os.path.join(temporary_directory, "load_test.db")
+
+        # Workers are started after this, so they connect to the same database file
+        previous_database_file = os.environ.get("HABITS_DATABASE")
+        os.environ["HABITS_DATABASE"] = str(database_file)
+        try:
+            yield database_file
+        finally:
+            if previous_database_file is None:
+                del os.environ["HABITS_DATABASE"]
+            else:
+                os.environ["HABITS_DATABASE"] = previous_database_file
+
+
+def run_load_test(workers = 4, operations_per_worker = 200, database_file = None, table_name = "habits"):
+    """
+    Runs concurrent simulated users against a local database and measures latencies.
+
+    Every worker runs in its own process with its own database connection, just
+    like several instances of the habit tracker would. If no database file is
+    given, a temporary one is created and removed afterwards.
+
+    Parameters:
+    - workers (int): The number of concurrent worker processes. Defaults to 4.
+    - operations_per_worker (int): The number of operations per worker. Defaults to 200.
+    - database_file (str or None): The database file to test against. Defaults to None.
+    - table_name (str): The name of the table where habit data is stored. Defaults to "habits".
+
+    Returns:
+    - report (dict): The total duration in seconds, the throughput in operations per
+      second and, per operation, the count, lock errors and p50/p95/p99 latencies in seconds.
+    """
+    with use_database_file(database_file):
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(workers) as pool:
+            pool.apply(create_tables, (table_name,))
+            start = time.perf_counter()
+            results = pool.starmap(run_worker, [(worker_id, operations_per_worker, table_name, worker_id) for worker_id in range(workers)])
+            duration = time.perf_counter() - start
+
+    report = {"duration": duration, "operations": {}}
+    completed_operations = 0
+    for operation in OPERATION_WEIGHTS:
+        latencies_sorted = sorted(latency for latencies, _ in results for latency in latencies[operation])
+        completed_operations += len(latencies_sorted)
+        report["operations"][operation] = {
+            "count":        len(latencies_sorted),
+            "lock_errors":  sum(lock_errors[operation] for _, lock_errors in results),
+            "p50":          percentile(latencies_sorted, 50),
+            "p95":          percentile(latencies_sorted, 95),
+            "p99":          percentile(latencies_sorted, 99)
+        }
+    report["throughput"] = completed_operations / duration
+    return report
+
+
+def run_buffer_worker(completions, table_name):
+    """
+    Measures the completion throughput with and without the completion buffer.
+
+    This function runs in its own process and uses the database configured through
+    the HABITS_DATABASE environment variable. Each mode completes its own habit on
+    different dates, and the buffered mode includes the final flush.
+
+    Parameters:
+    - completions (int): The number of completions per mode.
+    - table_name (str): The name of the table where habit data is stored.
+
+    Returns:
+    - throughput (dict of str to float): The completions per second for "unbuffered"
+      and "buffered".
+    """
+    # Imported here, so that the database module connects in the worker process
+    from functionality import add_habit
+    from database import (
+        create_table,
+        complete_habit,
+        enable_completion_buffer,
+        disable_completion_buffer
+    )
+
+    create_table(table_name)
+    today = datetime.today()
+    dates = [(today - timedelta(days = day)).strftime("%Y-%m-%d") for day in range(completions)]
+    throughput = {}
+    for mode in ["unbuffered", "buffered"]:
+        habit_name = "Habit {mode}".format(mode = mode)
+        add_habit(habit_name, "Buffer benchmark habit", "daily", table_name)
+        start = time.perf_counter()
+        if mode == "buffered":
+            enable_completion_buffer()
+        for date_completed in dates:
+            complete_habit(habit_name, date_completed, table_name)
+        if mode == "buffered":
+            disable_completion_buffer()
+        throughput[mode] = completions / (time.perf_counter() - start)
+    return throughput
+
+
+def run_buffer_benchmark(completions = 2000, database_file = None, table_name = "habits"):
+    """
+    Compares the throughput of complete_habit() with and without the completion buffer.
+
+    Parameters:
+    - completions (int): The number of completions per mode. Defaults to 2000.
+    - database_file (str or None): The database file to test against. Defaults to None,
+      which uses a temporary file.
+    - table_name (str): The name of the table where habit data is stored. Defaults to "habits".
+
+    Returns:
+    - report (dict): The completions per second "unbuffered" and "buffered", and the
+      "speedup" of the buffer.
+    """
+    with use_database_file(database_file):
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(1) as pool:
+            report = pool.apply(run_buffer_worker, (completions, table_name))
+    report["speedup"] = report["buffered"] / report["unbuffered"]
+    return report
+
+
+def print_report(report):
+    """
+    Prints a load test report as a table using rich console output.
+
+    Parameters:
+    - report (dict): The report returned by run_load_test().
+
+    Returns:
+    - None
+    """
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Operation")
+    table.add_column("Count")
+    table.add_column("Lock Errors")
+    table.add_column("p50 (ms)")
+    table.add_column("p95 (ms)")
+    table.add_column("p99 (ms)")
+
+    for operation, measurements in report["operations"].items():
+        table.add_row(operation, str(measurements["count"]), str(measurements["lock_errors"]),
+                      *["{:.2f}".format(measurements[percent] * 1000) for percent in ("p50", "p95", "p99")])
+
+    console = Console()
+    console.print(table)
+    console.print("Throughput: {:.0f} operations per second in {:.2f} seconds".format(report["throughput"], report["duration"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Simulates concurrent users of the habit tracker and reports latencies.")
+    parser.add_argument("--workers", type = int, default = 4, help = "number of concurrent worker processes")
+    parser.add_argument("--operations", type = int, default = 200, help = "number of operations per worker")
+    parser.add_argument("--database", default = None, help = "database file to test against (default: a temporary file)")
+    parser.add_argument("--table", default = "habits", help = "name of the habits table")
+    parser.add_argument("--buffer-benchmark", action = "store_true", help = "compare complete_habit() with and without the completion buffer instead")
+    parser.add_argument("--completions", type = int, default = 2000, help = "number of completions per mode of the buffer benchmark")
+    arguments = parser.parse_args()
+
+    if arguments.buffer_benchmark:
+        report = run_buffer_benchmark(arguments.completions, arguments.database, arguments.table)
+        print("Completions per second: {unbuffered:.0f} unbuffered, {buffered:.0f} buffered ({speedup:.1f}x)".format(**report))
+    else:
+        print_report(run_load_test(arguments.workers, arguments.operations, arguments.database, arguments.table))
@@ -3,25 +3,73 @@ from functionality import (
     add_habit, 
     create_overview_table,
     create_last_completion_dates_list,
-    create_list_of_available_completion_dates
+    create_list_of_available_completion_dates,
+    show_heatmaps,
+    HabitNameIndex,
+    HabitNameCompleter
 )
+from scheduler import HabitScheduler
 from database import (
     create_table,
     get_all_habit_names, 
+    get_all_habit_periodicities, 
     complete_habit, 
     delete_habit_data, 
-    delete_habit_completion_date
+    delete_habit_completion_date,
+    start_snapshot,
+    compact_completions
 )
 
 # Call the create_table function to ensure the table exists
 create_table()
 
+# Move completions older than a year into the archive to keep everyday queries fast
+compact_completions()
+
+# Keep the habit names in memory for type-ahead selection
+habit_index = HabitNameIndex(get_all_habit_names())
+
+# Keep track of which habits are due for reminders
+habit_scheduler = HabitScheduler()
+
+def select_habit(message):
+      """
+      Lets the user pick one of their habits by typing its name with type-ahead completion.
+      """
+      return questionary.autocomplete(
+            message,
+            choices = [],
+            completer = HabitNameCompleter(habit_index),
+            validate = lambda text: text in habit_index or "Please choose one of your habits."
+      ).ask()
+
 # Introduction: Greet the user and ask for their name
 user_name = questionary.text("Hi there! What's your name?").ask()
 
+# Snapshot that is being created in the background, if any, and how far it has got
+snapshot = None
+backup_percent = 0
+
+def record_backup_progress(pages_copied, pages_total):
+      """
+      Remembers the progress of the backup, which is reported in the main loop.
+      """
+      global backup_percent
+      backup_percent = pages_copied * 100 // max(pages_total, 1)
+
 # Main loop to continuously prompt the user for tasks
 while True:
 
+      # Report the progress of a running backup or the result of a finished one
+      if snapshot is not None and not snapshot.done():
+            print("Backing up your habits... {percent}%".format(percent = backup_percent))
+      elif snapshot is not None:
+            if snapshot.exception() is None:
+                  print("Your habits have been backed up to \"{snapshot_path}\".".format(snapshot_path = snapshot.result()))
+            else:
+                  print("Your habits could not be backed up: {error}".format(error = snapshot.exception()))
+            snapshot = None
+
       # Prompt user for task choice
       greeting_text = "Hi {name}, what would you like to do?".format(name=user_name)
 
@@ -32,70 +80,81 @@ while True:
                         "Delete a habit, including all its data",
                         "Delete a completion date",
                         "Show an overview of my currently tracked habits",
+                        "Show my open habits",
+                        "Show a calendar of my completions",
+                        "Back up my habits",
                         "Exit"]
       ).ask()
 
       # Execute the chosen task
       if task_choice == "Add a new habit":
             habit_name = questionary.text("What's the name of your new habit?").ask()
-            existing_habits = get_all_habit_names()
-            if habit_name in existing_habits:
+            if habit_name in habit_index:
                   print("\nThe given name aleady exists within your habit tracker.")
             else:
                   habit_task_specification = questionary.text("Please specify the task of your habit:").ask()
                   habit_periodicity = questionary.select(
-                        "Do you want to complete this habit daily or weekly?",
-                        choices = ["daily", "weekly"]
+                        "How often do you want to complete this habit?",
+                        choices = ["daily", "weekly", "monthly", "every N days", "N times per week"]
                   ).ask()
+                  if habit_periodicity == "every N days":
+                        number_of_days = questionary.text(
+                              "Every how many days?",
+                              validate = lambda text: text.isdigit() and int(text) > 0
+                        ).ask()
+                        habit_periodicity = "every {n} days".format(n = number_of_days)
+                  elif habit_periodicity == "N times per week":
+                        times_per_week = questionary.text(
+                              "How many times per week?",
+                              validate = lambda text: text.isdigit() and 0 < int(text) <= 7
+                        ).ask()
+                        habit_periodicity = "{n} times per week".format(n = times_per_week)
                   add_habit(habit_name, habit_task_specification, habit_periodicity)
+                  habit_index.add(habit_name)
+                  habit_scheduler.refresh(habit_name)
                   print("\nYour new habit \"{habit_name}\" has been added. Good luck!".format(habit_name = habit_name))
 
 
+      elif task_choice in ["Complete a habit", "Delete a habit, including all its data", "Delete a completion date"] and not len(habit_index):
+            print("\nYou have not added any habits yet.")
+
+
       elif task_choice == "Complete a habit":
-            habit_list = get_all_habit_names()
-            habit_name = questionary.select(
-                  "Which habit do you want to complete? These are your current ones:",
-                  choices = habit_list
-            ).ask()
+            habit_name = select_habit("Which habit do you want to complete? Start typing its name:")
             available_completion_dates = create_list_of_available_completion_dates(habit_name)
             date_completed = questionary.select(
                   "When did you complete the habit?",
                   choices = available_completion_dates
             ).ask()
             complete_habit(habit_name, date_completed)
+            habit_scheduler.refresh(habit_name)
             print("\nThe date has been saved.\n")
 
                   
       elif task_choice == "Delete a habit, including all its data":
-            habit_names = get_all_habit_names()
-            
-            habit_name = questionary.select(
-                  "Which habit do you want to delete?",
-                  choices = habit_names
-            ).ask()
+            habit_name = select_habit("Which habit do you want to delete? Start typing its name:")
 
             delete_habit_data(habit_name)
+            habit_index.remove(habit_name)
+            habit_scheduler.remove(habit_name)
             print("\nYour habit \"{habit_name}\", including all its data, has been deleted.".format(habit_name = habit_name))
 
 
       elif task_choice == "Delete a completion date":
-            habit_names = get_all_habit_names()
-            habit_name = questionary.select(
-                  "For which habit do you want to delete a completion date?",
-                  choices = habit_names
-            ).ask()
+            habit_name = select_habit("For which habit do you want to delete a completion date? Start typing its name:")
             last_completion_dates = create_last_completion_dates_list(habit_name)
             habit_completion_date = questionary.select(
                   "Which of your last completion dates do you want to delete?",
                   last_completion_dates
             ).ask()
             delete_habit_completion_date(habit_name, habit_completion_date)
+            habit_scheduler.refresh(habit_name)
             print("\nThe completion date \"{habit_completion_date}\" for your habit \"{habit_name}\" has been deleted."
                         .format(habit_completion_date = habit_completion_date, habit_name = habit_name))
             
 
       elif task_choice == "Show an overview of my currently tracked habits":
-            periodicity_list = ["all","daily","weekly"]
+            periodicity_list = ["all"] + get_all_habit_periodicities()
             periodicity_choice = questionary.select(
                   "Which habits do you want to be shown?",
                   choices = periodicity_list
@@ -110,7 +169,30 @@ while True:
             input()
 
 
+      elif task_choice == "Show my open habits":
+            reminders = habit_scheduler.create_reminders()
+            if not reminders:
+                  print("\nWell done! All your habits are completed for now.")
+            for reminder in reminders:
+                  print(reminder)
+
+
+      elif task_choice == "Show a calendar of my completions":
+            show_heatmaps()
+            print("\nPlease click enter after you have finished analysing your habits.")
+            input()
+
+
+      elif task_choice == "Back up my habits":
+            backup_percent = 0
+            snapshot = start_snapshot(progress = record_backup_progress)
+            print("\nYour habits are being backed up in the background. You can keep using the habit tracker.")
+
+
       elif task_choice == "Exit":
+            if snapshot is not None:
+                  print("\nWaiting for the backup to finish ({percent}% done)...".format(percent = backup_percent))
+                  snapshot.exception()
             print("\nSee you!")
             break
 
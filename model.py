@@ -1,3 +1,4 @@
+import re
 import datetime
 
 class Habit:
@@ -10,7 +11,8 @@ class Habit:
   Attributes:
   - habit_name (str): The name of the habit.
   - habit_task_specification (str): The task specification of the habit.
-  - habit_periodicity (str): The periodicity of the habit (e.g., daily or weekly).
+  - habit_periodicity (str): The periodicity of the habit (e.g., daily, weekly, monthly, 
+    every N days or N times per week), see parse_periodicity().
   - date_added (str): The date when the habit was added, in the format 'YYYY-MM-DD'.
   - date_completed (str or None): The date when the habit was last completed, 
     in the format 'YYYY-MM-DD', or None if the habit hasn't been completed yet.
@@ -20,4 +22,93 @@ class Habit:
     self.habit_task_specification   = habit_task_specification
     self.habit_periodicity          = habit_periodicity
     self.date_added                 = str(datetime.datetime.now().date())
-    self.date_completed             = date_completed
\ No newline at end of file
+    self.date_completed             = date_completed
+
+class Periodicity:
+  """
+  Represents how often a habit has to be completed.
+
+  A periodicity splits the calendar into consecutive periods and states how many 
+  distinct days within one period the habit has to be completed on. Every period 
+  is identified by an integer ordinal, so that consecutive periods have consecutive 
+  ordinals regardless of month or year boundaries.
+
+  Attributes:
+  - name (str): The periodicity as stored in the database (e.g., 'daily' or '3 times per week').
+  - period_of (callable): A function mapping a date or datetime to its period ordinal.
+  - first_day_of (callable): A function mapping a period ordinal to the day ordinal 
+    of the first day of the period.
+  - quota (int): The number of distinct days per period the habit has to be completed on.
+  """
+  def __init__(self, name, period_of, first_day_of, quota = 1):
+    self.name          = name
+    self.period_of     = period_of
+    self.first_day_of  = first_day_of
+    self.quota         = quota
+
+
+def _day_ordinal(date):
+  return date.toordinal()
+
+
+def _week_ordinal(date):
+  # Ordinal 1 (0001-01-01) is a Monday, so weeks start on Monday like ISO calendar weeks
+  return (date.toordinal() - 1) // 7
+
+
+def _month_ordinal(date):
+  return date.year * 12 + date.month - 1
+
+
+def _first_day_of_day(period):
+  return period
+
+
+def _first_day_of_week(period):
+  return period * 7 + 1
+
+
+def _first_day_of_month(period):
+  return datetime.date(period // 12, period % 12 + 1, 1).toordinal()
+
+
+def parse_periodicity(habit_periodicity, date_added = None):
+  """
+  Creates a Periodicity from its textual representation.
+
+  Supported periodicities are 'daily', 'weekly', 'monthly', 'every N days' and 
+  'N times per week' (also written as 'Nx per week'). Periods of 'every N days' 
+  are consecutive blocks of N days starting on the day the habit was added.
+
+  Parameters:
+  - habit_periodicity (str): The periodicity of a habit, as stored in the database.
+  - date_added (str or None): The date when the habit was added, in the format 
+    'YYYY-MM-DD'. It is only used for 'every N days' and can be left out if the 
+    periodicity is merely validated. Defaults to None, which starts the blocks 
+    on 0001-01-01.
+
+  Returns:
+  - periodicity (Periodicity): The parsed periodicity.
+
+  Raises:
+  - ValueError: If the periodicity is not supported.
+  """
+  if habit_periodicity == "daily":
+    return Periodicity(habit_periodicity, _day_ordinal, _first_day_of_day)
+  if habit_periodicity == "weekly":
+    return Periodicity(habit_periodicity, _week_ordinal, _first_day_of_week)
+  if habit_periodicity == "monthly":
+    return Periodicity(habit_periodicity, _month_ordinal, _first_day_of_month)
+
+  every_n_days = re.fullmatch(r"every (\d+) days?", habit_periodicity)
+  if every_n_days and int(every_n_days.group(1)) > 0:
+    days = int(every_n_days.group(1))
+    # Period 0 starts on the day the habit was added
+    first_day = datetime.date.fromisoformat(date_added).toordinal() if date_added is not None else 1
+    return Periodicity(habit_periodicity, lambda date: (date.toordinal() - first_day) // days, lambda period: first_day + period * days)
+
+  times_per_week = re.fullmatch(r"(\d+)(?: times|x) per week", habit_periodicity)
+  if times_per_week and 0 < int(times_per_week.group(1)) <= 7:
+    return Periodicity(habit_periodicity, _week_ordinal, _first_day_of_week, int(times_per_week.group(1)))
+
+  raise ValueError(f"Unsupported periodicity: {habit_periodicity!r}")
@@ -0,0 +1,165 @@
+import heapq
+import datetime
+from model import parse_periodicity
+from analysis import (
+    determine_completed_periods,
+    determine_completed_period_runs
+)
+from database import (
+    get_all_dates_completed,
+    get_archived_segments,
+    get_dates_completed,
+    get_habit_periodicity,
+    get_habit_date_added
+)
+
+def determine_next_due_day(all_dates_completed_sorted, periodicity, today, archived_segments = ()):
+    """
+    Determines the day from which a habit is due again.
+
+    A habit is due from the first day of the period after its last completed period.
+    If no completed period is left in the habits table, the last completed period
+    of the archived history is used instead. If it has no completed period at all,
+    it is due from the first day of the current period.
+
+    Parameters:
+    - all_dates_completed_sorted (list of datetime): The completion dates of the
+      habit in the habits table, sorted in ascending order.
+    - periodicity (Periodicity): The periodicity of the habit.
+    - today (date or datetime): The current date.
+    - archived_segments (list of (int, int)): The archived runs of completion days,
+      see get_archived_segments(). Defaults to an empty tuple.
+
+    Returns:
+    - next_due_day (int): The day ordinal from which the habit is due.
+    """
+    completed_periods = determine_completed_periods(all_dates_completed_sorted, periodicity)
+    if completed_periods:
+        return periodicity.first_day_of(completed_periods[-1] + 1)
+    # compact_completions() keeps the current and the previous period in the habits 
+    # table, so older periods are only found in the archive
+    completed_period_runs = determine_completed_period_runs(archived_segments, periodicity)
+    if completed_period_runs:
+        return periodicity.first_day_of(completed_period_runs[-1][1] + 1)
+    return periodicity.first_day_of(periodicity.period_of(today))
+
+
+class HabitScheduler:
+    """
+    Keeps track of when each habit is due again, using a priority queue.
+
+    The queue holds (next due day, habit name) entries ordered by day. When a habit
+    is refreshed or removed, its old entry stays in the queue and is skipped later,
+    because the up-to-date due day of every habit is also kept in a dictionary.
+    The scheduler has to be refreshed whenever a habit is added, completed or has
+    a completion date deleted, and a habit has to be removed when it is deleted.
+
+    Parameters:
+    - table_name (str): The name of the table where habit data is stored.
+      Defaults to "habits".
+    - connection (sqlite3.Connection or None): The connection to use instead of the
+      database module's connection. Defaults to None.
+    """
+    def __init__(self, table_name = "habits", connection = None):
+        self.table_name = table_name
+        self.connection = connection
+        # habit_name -> day ordinal from which the habit is due
+        self._next_due_days = {}
+
+        # Load all habits with a single query
+        today = datetime.datetime.now()
+        for habit_name, (habit_periodicity, date_added, all_dates_completed_sorted) in get_all_dates_completed(table_name, connection).items():
+            periodicity = parse_periodicity(habit_periodicity, date_added)
+            self._next_due_days[habit_name] = self._determine_next_due_day(habit_name, all_dates_completed_sorted, periodicity, today)
+
+        # Heap of (day ordinal, habit_name), possibly containing outdated entries
+        self._queue = [(next_due_day, habit_name) for habit_name, next_due_day in self._next_due_days.items()]
+        heapq.heapify(self._queue)
+
+    def __len__(self):
+        return len(self._next_due_days)
+
+    def refresh(self, habit_name):
+        """
+        Recalculates when a habit is due, after it was added, completed or had a date deleted.
+
+        Parameters:
+        - habit_name (str): The name of the habit.
+
+        Returns:
+        - None
+        """
+        all_dates_completed_sorted = get_dates_completed(habit_name, self.table_name, connection = self.connection)
+        periodicity = parse_periodicity(get_habit_periodicity(habit_name, self.table_name, self.connection),
+                                        get_habit_date_added(habit_name, self.table_name, self.connection))
+        next_due_day = self._determine_next_due_day(habit_name, all_dates_completed_sorted, periodicity, datetime.datetime.now())
+
+        if self._next_due_days.get(habit_name) != next_due_day:
+            self._next_due_days[habit_name] = next_due_day
+            heapq.heappush(self._queue, (next_due_day, habit_name))
+
+    def _determine_next_due_day(self, habit_name, all_dates_completed_sorted, periodicity, today):
+        """
+        Determines when a habit is due, see determine_next_due_day(). The archive is
+        only read for habits without a completed period in the habits table.
+        """
+        archived_segments = ()
+        if not determine_completed_periods(all_dates_completed_sorted, periodicity):
+            archived_segments = get_archived_segments(habit_name, self.table_name, self.connection)
+        return determine_next_due_day(all_dates_completed_sorted, periodicity, today, archived_segments)
+
+    def remove(self, habit_name):
+        """
+        Removes a deleted habit from the scheduler.
+
+        Parameters:
+        - habit_name (str): The name of the habit.
+
+        Returns:
+        - None
+        """
+        self._next_due_days.pop(habit_name, None)
+
+    def due_habits(self, today = None):
+        """
+        Returns the habits that are due, i.e. not yet completed for the current period.
+
+        Only the k due entries at the front of the queue are visited, so this takes
+        O(k log n) time for n habits, apart from skipping outdated entries once.
+
+        Parameters:
+        - today (date or datetime or None): The current date. Defaults to None, which
+          uses today's date.
+
+        Returns:
+        - due_habits (list of (str, date)): The names of the due habits together with
+          the date from which they are due, the longest overdue first.
+        """
+        today_day = (today or datetime.datetime.now()).toordinal()
+        # habit_name -> day ordinal, in the order the entries leave the queue
+        due_entries = {}
+        while self._queue and self._queue[0][0] <= today_day:
+            next_due_day, habit_name = heapq.heappop(self._queue)
+            # Skip entries of removed habits and entries replaced by a refresh
+            if self._next_due_days.get(habit_name) == next_due_day:
+                due_entries[habit_name] = next_due_day
+
+        # Due habits stay in the queue until they are completed
+        for habit_name, next_due_day in due_entries.items():
+            heapq.heappush(self._queue, (next_due_day, habit_name))
+
+        return [(habit_name, datetime.date.fromordinal(next_due_day)) for habit_name, next_due_day in due_entries.items()]
+
+    def create_reminders(self, today = None):
+        """
+        Creates a reminder message for every habit that is due.
+
+        Parameters:
+        - today (date or datetime or None): The current date. Defaults to None, which
+          uses today's date.
+
+        Returns:
+        - reminders (list of str): One reminder per due habit, the longest overdue first.
+        """
+        return ["\"{habit_name}\" is due since {due_date}.".format(habit_name = habit_name, due_date = due_date.strftime("%Y-%m-%d"))
+                for habit_name, due_date in self.due_habits(today)]
@@ -0,0 +1,321 @@
+import os
+import zlib
+import sqlite3
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from bisect import (
+    bisect_left,
+    bisect_right,
+    insort
+)
+from datetime import datetime
+from typing import Protocol
+import database
+
+class StorageBackend(Protocol):
+    """
+    Describes the storage operations the analysis of habits relies on.
+
+    The methods mirror the module-level functions of the database module, without
+    the table_name parameter, which is chosen when a backend is created.
+    """
+    def create_table(self): ...
+    def insert_habit(self, habit): ...
+    def get_all_habit_names(self): ...
+    def get_habit_names_by_periodicity(self, habit_periodicity): ...
+    def get_all_habit_periodicities(self): ...
+    def complete_habit(self, habit_name, date_completed): ...
+    def get_dates_completed(self, habit_name, include_archived = False): ...
+    def get_completion_segments(self, habit_name): ...
+    def get_habit_periodicity(self, habit_name): ...
+    def get_habit_task_specification(self, habit_name): ...
+    def get_habit_date_added(self, habit_name): ...
+    def delete_habit_data(self, habit_name): ...
+    def delete_habit_completion_date(self, habit_name, habit_completion_date): ...
+    def get_data_version(self): ...
+
+
+class SQLiteBackend:
+    """
+    Stores habits in a SQLite table using the functions of the database module.
+
+    Attributes:
+    - table_name (str): The name of the table where the habits are stored.
+    - connection (sqlite3.Connection or None): The connection to use, or None for
+      the database module's connection.
+    """
+    def __init__(self, table_name = "habits", connection = None):
+        self.table_name = table_name
+        self.connection = connection
+
+    def create_table(self):
+        database.create_table(self.table_name, self.connection)
+
+    def insert_habit(self, habit):
+        database.insert_habit(habit, self.table_name, self.connection)
+
+    def get_all_habit_names(self):
+        return database.get_all_habit_names(self.table_name, self.connection)
+
+    def get_habit_names_by_periodicity(self, habit_periodicity):
+        return database.get_habit_names_by_periodicity(habit_periodicity, self.table_name, self.connection)
+
+    def get_all_habit_periodicities(self):
+        return database.get_all_habit_periodicities(self.table_name, self.connection)
+
+    def complete_habit(self, habit_name, date_completed):
+        database.complete_habit(habit_name, date_completed, self.table_name, self.connection)
+
+    def get_dates_completed(self, habit_name, include_archived = False):
+        return database.get_dates_completed(habit_name, self.table_name, include_archived, self.connection)
+
+    def get_completion_segments(self, habit_name):
+        return database.get_completion_segments(habit_name, self.table_name, self.connection)
+
+    def get_habit_periodicity(self, habit_name):
+        return database.get_habit_periodicity(habit_name, self.table_name, self.connection)
+
+    def get_habit_task_specification(self, habit_name):
+        return database.get_habit_task_specification(habit_name, self.table_name, self.connection)
+
+    def get_habit_date_added(self, habit_name):
+        return database.get_habit_date_added(habit_name, self.table_name, self.connection)
+
+    def delete_habit_data(self, habit_name):
+        database.delete_habit_data(habit_name, self.table_name, self.connection)
+
+    def delete_habit_completion_date(self, habit_name, habit_completion_date):
+        database.delete_habit_completion_date(habit_name, habit_completion_date, self.table_name, self.connection)
+
+    def get_data_version(self):
+        return database.get_data_version(self.connection)
+
+
+class InMemoryBackend:
+    """
+    Stores habits in memory, without any disk I/O.
+
+    Habits are kept in a dictionary by name and the completions of every habit in
+    a sorted array of day ordinals. This backend behaves like SQLiteBackend and is
+    meant for unit tests and short-lived batch jobs. There is no archive, so all
+    completions are always returned.
+    """
+    def __init__(self):
+        # habit_name -> Habit
+        self._habits = {}
+        # habit_name -> sorted array of the day ordinals of all completions
+        self._completions = {}
+        self._changes = 0
+
+    def create_table(self):
+        pass
+
+    def insert_habit(self, habit):
+        # Like the SQLite table, the first entry of a habit name determines its details
+        self._habits.setdefault(habit.habit_name, habit)
+        self._completions.setdefault(habit.habit_name, array('l'))
+        if habit.date_completed is not None:
+            insort(self._completions[habit.habit_name], _day_of(habit.date_completed))
+        self._changes += 1
+
+    def get_all_habit_names(self):
+        return list(self._habits)
+
+    def get_habit_names_by_periodicity(self, habit_periodicity):
+        return [habit_name for habit_name, habit in self._habits.items() if habit.habit_periodicity == habit_periodicity]
+
+    def get_all_habit_periodicities(self):
+        return sorted({habit.habit_periodicity for habit in self._habits.values()})
+
+    def complete_habit(self, habit_name, date_completed):
+        # Completions of unknown habits are ignored, just like in the SQLite table
+        if habit_name in self._habits:
+            insort(self._completions[habit_name], _day_of(date_completed))
+            self._changes += 1
+
+    def get_dates_completed(self, habit_name, include_archived = False):
+        return [datetime.fromordinal(day) for day in self._completions.get(habit_name, ())]
+
+    def get_completion_segments(self, habit_name):
+        completion_segments = []
+        for day in self._completions.get(habit_name, ()):
+            # Extend the last run of days, unless the day is neither the same nor the next one
+            if completion_segments and day <= completion_segments[-1][1] + 1:
+                completion_segments[-1] = (completion_segments[-1][0], day)
+            else:
+                completion_segments.append((day, day))
+        return completion_segments
+
+    def get_habit_periodicity(self, habit_name):
+        return self._habits[habit_name].habit_periodicity
+
+    def get_habit_task_specification(self, habit_name):
+        return self._habits[habit_name].habit_task_specification
+
+    def get_habit_date_added(self, habit_name):
+        return self._habits[habit_name].date_added
+
+    def delete_habit_data(self, habit_name):
+        self._habits.pop(habit_name, None)
+        self._completions.pop(habit_name, None)
+        self._changes += 1
+
+    def delete_habit_completion_date(self, habit_name, habit_completion_date):
+        days = self._completions.get(habit_name)
+        if days is not None:
+            day = _day_of(habit_completion_date)
+            # Delete every completion on that day
+            del days[bisect_left(days, day):bisect_right(days, day)]
+            self._changes += 1
+
+    def get_data_version(self):
+        return self._changes
+
+
+class ShardedBackend:
+    """
+    Spreads habits over several SQLite files to allow parallel writes.
+
+    Every habit is stored in the shard given by a stable hash of its name, so all
+    entries of a habit live in the same file. Each shard has its own connection and
+    lock, so writes to different shards run in parallel threads; SQLite releases
+    the GIL while it executes statements and commits. Queries about all habits are
+    sent to every shard in parallel and the results are merged.
+
+    Parameters:
+    - shard_paths (list of str): The database files of the shards.
+    - table_name (str): The name of the table where the habits are stored in every
+      shard. Defaults to "habits".
+    """
+    def __init__(self, shard_paths, table_name = "habits"):
+        self.shard_paths = list(shard_paths)
+        self.table_name = table_name
+        # Connections are shared between threads, but only used while holding the shard's lock
+        self.shards = [SQLiteBackend(table_name, sqlite3.connect(shard_path, check_same_thread = False)) for shard_path in self.shard_paths]
+        self._locks = [threading.Lock() for _ in self.shards]
+        self._executor = ThreadPoolExecutor(max_workers = len(self.shards))
+        self.create_table()
+
+    @classmethod
+    def in_directory(cls, directory, shard_count, table_name = "habits"):
+        """
+        Creates a sharded backend with shard_count files named 'habits-<n>.db' in a directory.
+        """
+        os.makedirs(directory, exist_ok = True)
+        return cls([os.path.join(directory, "habits-{n}.db".format(n = n)) for n in range(shard_count)], table_name)
+
+    def shard_index(self, habit_name):
+        """
+        Returns the index of the shard a habit is stored in.
+
+        CRC32 is used instead of hash(), because it is the same in every process.
+        """
+        return zlib.crc32(habit_name.encode("utf-8")) % len(self.shards)
+
+    def _call(self, habit_name, method, *arguments):
+        index = self.shard_index(habit_name)
+        with self._locks[index]:
+            return getattr(self.shards[index], method)(habit_name, *arguments)
+
+    def map_shards(self, function):
+        """
+        Calls a function with the backend of every shard in parallel.
+
+        Parameters:
+        - function (callable): A function taking a SQLiteBackend.
+
+        Returns:
+        - results (list): The results of the function, in the order of the shards.
+        """
+        return self._map_indexes(lambda index: function(self.shards[index]))
+
+    def _map_indexes(self, function):
+        """
+        Calls a function with the index of every shard in parallel, holding the lock of the shard.
+        """
+        def call_locked(index):
+            with self._locks[index]:
+                return function(index)
+        return list(self._executor.map(call_locked, range(len(self.shards))))
+
+    def close(self):
+        """
+        Waits for running tasks and closes the connections of all shards.
+        """
+        self._executor.shutdown()
+        for shard in self.shards:
+            shard.connection.close()
+
+    def create_table(self):
+        self.map_shards(lambda shard: shard.create_table())
+
+    def insert_habit(self, habit):
+        index = self.shard_index(habit.habit_name)
+        with self._locks[index]:
+            self.shards[index].insert_habit(habit)
+
+    def get_all_habit_names(self):
+        return [habit_name for habit_names in self.map_shards(lambda shard: shard.get_all_habit_names()) for habit_name in habit_names]
+
+    def get_habit_names_by_periodicity(self, habit_periodicity):
+        return [habit_name for habit_names in self.map_shards(lambda shard: shard.get_habit_names_by_periodicity(habit_periodicity))
+                for habit_name in habit_names]
+
+    def get_all_habit_periodicities(self):
+        return sorted({periodicity for periodicities in self.map_shards(lambda shard: shard.get_all_habit_periodicities())
+                       for periodicity in periodicities})
+
+    def complete_habit(self, habit_name, date_completed):
+        self._call(habit_name, "complete_habit", date_completed)
+
+    def complete_habits(self, completions):
+        """
+        Marks many habits as completed, writing to all shards in parallel.
+
+        Parameters:
+        - completions (iterable of (str, str)): Pairs of habit name and completion
+          date, in the format 'YYYY-MM-DD'.
+
+        Returns:
+        - None
+        """
+        completions_by_shard = [[] for _ in self.shards]
+        for habit_name, date_completed in completions:
+            completions_by_shard[self.shard_index(habit_name)].append((habit_name, date_completed))
+
+        def complete_shard(index):
+            for habit_name, date_completed in completions_by_shard[index]:
+                self.shards[index].complete_habit(habit_name, date_completed)
+        self._map_indexes(complete_shard)
+
+    def get_dates_completed(self, habit_name, include_archived = False):
+        return self._call(habit_name, "get_dates_completed", include_archived)
+
+    def get_completion_segments(self, habit_name):
+        return self._call(habit_name, "get_completion_segments")
+
+    def get_habit_periodicity(self, habit_name):
+        return self._call(habit_name, "get_habit_periodicity")
+
+    def get_habit_task_specification(self, habit_name):
+        return self._call(habit_name, "get_habit_task_specification")
+
+    def get_habit_date_added(self, habit_name):
+        return self._call(habit_name, "get_habit_date_added")
+
+    def delete_habit_data(self, habit_name):
+        self._call(habit_name, "delete_habit_data")
+
+    def delete_habit_completion_date(self, habit_name, habit_completion_date):
+        self._call(habit_name, "delete_habit_completion_date", habit_completion_date)
+
+    def get_data_version(self):
+        return tuple(self.map_shards(lambda shard: shard.get_data_version()))
+
+
+def _day_of(date_string):
+    """
+    Returns the day ordinal of a date in the format 'YYYY-MM-DD'.
+    """
+    return datetime.strptime(date_string, "%Y-%m-%d").toordinal()
@@ -1,7 +1,23 @@
+import io
+import os
+import json
+import time
 import pytest
 import sqlite3
-from model import Habit
+import threading
+import urllib.request
+import urllib.error
+from datetime import (
+    datetime,
+    timedelta
+)
+from rich.console import Console
+from model import (
+    Habit,
+    parse_periodicity
+)
 from freezegun import freeze_time
+import database
 from database import (
     create_table,
     insert_habit,
@@ -13,56 +29,91 @@ from database import (
     get_habit_periodicity,
     get_habit_task_specification,
     delete_habit_data,
-    delete_habit_completion_date
+    delete_habit_completion_date,
+    enable_completion_buffer,
+    disable_completion_buffer,
+    flush_completion_buffer,
+    create_snapshot,
+    start_snapshot,
+    compact_completions,
+    get_all_completion_segments,
+    get_changes_since,
+    get_last_change_sequence,
+    get_node_id,
+    apply_changes
 )
 from analysis import(
+    determine_completed_periods,
+    determine_completed_period_runs,
     determine_completion,
-    determine_streaks
+    determine_streaks,
+    determine_habit_statistics
 )
 from functionality import(
     add_habit,
     create_last_completion_dates_list,
     create_list_of_available_completion_dates,
-    create_overview_table
+    create_overview_rows,
+    create_overview_table,
+    create_completion_bitmap,
+    create_heatmaps,
+    show_heatmaps,
+    HabitNameIndex
+)
+from storage import (
+    InMemoryBackend,
+    SQLiteBackend,
+    ShardedBackend
+)
+from scheduler import HabitScheduler
+from api import (
+    create_server,
+    HabitRequestHandler
+)
+from load_test import (
+    percentile,
+    run_load_test,
+    run_buffer_benchmark
 )
 
 # naming the test table
 table_name = "test_habits"
 
+# Habits of the test data
+habits = [
+    ("Cook", "I want to cook dinner.", "daily"),
+    ("Read", "I want to read 30 minutes.", "daily"),
+    ("Go to bed early", "I want to go to bed before 10pm.", "daily"),
+    ("Meet a friend", "I want to meet with a friend in town.", "weekly"),
+    ("Run", "I want to run 10km.", "weekly")
+]
+
+# Dictionary mapping habits to lists of completion dates
+habit_completions = {
+    "Cook":             ["2024-04-01", "2024-04-02", "2024-04-03", "2024-04-04", "2024-04-05", "2024-04-08", "2024-04-09",
+                         "2024-04-10", "2024-04-12", "2024-04-13", "2024-04-14", "2024-04-15", "2024-04-16", "2024-04-17",
+                         "2024-04-18", "2024-04-19", "2024-04-20", "2024-04-21", "2024-04-22", "2024-04-23", "2024-04-24", 
+                         "2024-04-27", "2024-04-28"],
+    "Read":             ["2024-04-01", "2024-04-02", "2024-04-05", "2024-04-06", "2024-04-07", "2024-04-08", "2024-04-09",
+                         "2024-04-10", "2024-04-11", "2024-04-12", "2024-04-13", "2024-04-14", "2024-04-15", "2024-04-16",
+                         "2024-04-18", "2024-04-19", "2024-04-20", "2024-04-21", "2024-04-22", "2024-04-23", "2024-04-24", 
+                         "2024-04-26"],
+    "Go to bed early":  ["2024-04-03", "2024-04-04", "2024-04-05", "2024-04-06", "2024-04-07", "2024-04-08", "2024-04-09",
+                         "2024-04-11", "2024-04-12", "2024-04-17", "2024-04-18", "2024-04-19", "2024-04-20", "2024-04-21",
+                         "2024-04-22", "2024-04-23", "2024-04-24", "2024-04-25", "2024-04-26", "2024-04-27"],
+    "Meet a friend":    ["2024-04-02", "2024-04-12", "2024-04-15", "2024-04-26"],
+    "Run":              ["2024-04-04", "2024-04-12"]
+}
+
 # Fixture to create the table before the test runs
 @pytest.fixture
 def setup_habit_data():
     create_table(table_name)
     
-    habits = [
-        ("Cook", "I want to cook dinner.", "daily"),
-        ("Read", "I want to read 30 minutes.", "daily"),
-        ("Go to bed early", "I want to go to bed before 10pm.", "daily"),
-        ("Meet a friend", "I want to meet with a friend in town.", "weekly"),
-        ("Run", "I want to run 10km.", "weekly")
-    ]
-    
     for name, description, periodicity in habits:
         habit = Habit(name, description, periodicity)
         insert_habit(habit, table_name)
 
-    # Dictionary mapping habits to lists of completion dates
-    habit_completions = {
-        "Cook":             ["2024-04-01", "2024-04-02", "2024-04-03", "2024-04-04", "2024-04-05", "2024-04-08", "2024-04-09",
-                             "2024-04-10", "2024-04-12", "2024-04-13", "2024-04-14", "2024-04-15", "2024-04-16", "2024-04-17",
-                             "2024-04-18", "2024-04-19", "2024-04-20", "2024-04-21", "2024-04-22", "2024-04-23", "2024-04-24", 
-                             "2024-04-27", "2024-04-28"],
-        "Read":             ["2024-04-01", "2024-04-02", "2024-04-05", "2024-04-06", "2024-04-07", "2024-04-08", "2024-04-09",
-                             "2024-04-10", "2024-04-11", "2024-04-12", "2024-04-13", "2024-04-14", "2024-04-15", "2024-04-16",
-                             "2024-04-18", "2024-04-19", "2024-04-20", "2024-04-21", "2024-04-22", "2024-04-23", "2024-04-24", 
-                             "2024-04-26"],
-        "Go to bed early":  ["2024-04-03", "2024-04-04", "2024-04-05", "2024-04-06", "2024-04-07", "2024-04-08", "2024-04-09",
-                             "2024-04-11", "2024-04-12", "2024-04-17", "2024-04-18", "2024-04-19", "2024-04-20", "2024-04-21",
-                             "2024-04-22", "2024-04-23", "2024-04-24", "2024-04-25", "2024-04-26", "2024-04-27"],
-        "Meet a friend":    ["2024-04-02", "2024-04-12", "2024-04-15", "2024-04-26"],
-        "Run":              ["2024-04-04", "2024-04-12"]
-    }
-
     # Complete each habit for each date
     for habit_name, dates in habit_completions.items():
         for date_completed in dates:
@@ -72,12 +123,33 @@ def setup_habit_data():
     yield
     
     # Teardown: Drop the table after the test has finished
+    delete_test_tables(table_name)
+
+# Drops a test table together with its archive and change log
+def delete_test_tables(table_name):
     conn = sqlite3.connect('habits.db')
     c = conn.cursor()
     c.execute(f"DROP TABLE IF EXISTS {table_name}")
+    c.execute(f"DROP TABLE IF EXISTS {table_name}_archive")
+    c.execute(f"DROP TABLE IF EXISTS {table_name}_changes")
+    c.execute(f"DROP TABLE IF EXISTS {table_name}_node_id")
     conn.commit()
     conn.close()
 
+# Fixture to create the same habit data in memory
+@pytest.fixture
+def in_memory_backend():
+    backend = InMemoryBackend()
+
+    for name, description, periodicity in habits:
+        backend.insert_habit(Habit(name, description, periodicity))
+
+    for habit_name, dates in habit_completions.items():
+        for date_completed in dates:
+            backend.complete_habit(habit_name, date_completed)
+
+    return backend
+
 def test_inserted_habit_data(setup_habit_data):
     habits = get_all_habit_names(table_name)
     assert len(habits) == 5
@@ -123,6 +195,248 @@ def test_deleted_completion_date(setup_habit_data):
     entries = get_dates_completed("Cook", table_name)
     assert len(entries) == 22
 
+def test_completion_buffer(setup_habit_data):
+    enable_completion_buffer(max_size = 100, max_age = 3600)
+    try:
+        complete_habit("Run", "2024-04-20", table_name)
+        complete_habit("Run", "2024-04-20", table_name) # duplicate completion should be coalesced
+        complete_habit("Run", "2024-04-21", table_name)
+        delete_habit_completion_date("Run", "2024-04-21", table_name)
+
+        # Buffered completions are visible to reads, but not yet written
+        assert len(get_dates_completed("Run", table_name)) == 3
+        conn = sqlite3.connect('habits.db')
+        stored_entries = conn.execute(f"SELECT COUNT(*) FROM {table_name} WHERE habit_name = 'Run'").fetchone()[0]
+        assert stored_entries == 3 # the habit itself and two completions
+
+        flush_completion_buffer()
+        stored_entries = conn.execute(f"SELECT COUNT(*) FROM {table_name} WHERE habit_name = 'Run'").fetchone()[0]
+        assert stored_entries == 4
+        conn.close()
+        assert len(get_dates_completed("Run", table_name)) == 3
+    finally:
+        disable_completion_buffer()
+
+def test_completion_buffer_max_age(setup_habit_data):
+    enable_completion_buffer(max_size = 100, max_age = 0.05)
+    try:
+        complete_habit("Run", "2024-04-20", table_name)
+        # The completion is written after max_age seconds, without any further call
+        deadline = time.monotonic() + 5
+        conn = sqlite3.connect('habits.db')
+        while conn.execute(f"SELECT COUNT(*) FROM {table_name} WHERE habit_name = 'Run'").fetchone()[0] < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stored_entries = conn.execute(f"SELECT COUNT(*) FROM {table_name} WHERE habit_name = 'Run'").fetchone()[0]
+        conn.close()
+        assert stored_entries == 4
+        assert len(get_dates_completed("Run", table_name)) == 3
+    finally:
+        disable_completion_buffer()
+
+def test_completion_buffer_failed_flush(setup_habit_data):
+    buffer = database.CompletionBuffer(max_size = 2, max_age = 60)
+    connection = buffer._connection
+    try:
+        buffer.add("Run", "2024-04-20", table_name)
+        # The flush triggered by the second completion fails
+        buffer._connection = sqlite3.connect('habits.db')
+        buffer._connection.close()
+        with pytest.raises(sqlite3.Error):
+            buffer.add("Run", "2024-04-21", table_name)
+        # Only the completion whose call failed is dropped, the earlier one is retried
+        assert buffer.pending_dates("Run", table_name) == ["2024-04-20"] and len(buffer) == 1
+        buffer._connection = connection
+        buffer.flush()
+        assert [date.strftime("%Y-%m-%d") for date in get_dates_completed("Run", table_name)][-1] == "2024-04-20"
+    finally:
+        buffer._connection = connection
+        buffer.close()
+
+def test_create_snapshot(setup_habit_data, tmp_path):
+    for _ in range(3):
+        snapshot_path = create_snapshot(tmp_path, keep = 2)
+    assert len(list(tmp_path.iterdir())) == 2 # only the newest two snapshots are kept
+
+    conn = sqlite3.connect(snapshot_path)
+    backed_up_entries = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+    conn.close()
+    assert backed_up_entries == 76 # five habits and 71 completions
+
+def test_create_snapshot_with_concurrent_writer(setup_habit_data, tmp_path):
+    # Make the database large enough for the backup to take a while
+    conn = sqlite3.connect('habits.db')
+    with conn:
+        conn.executemany(f"INSERT INTO {table_name} VALUES ('Filler', ?, 'daily', '2024-01-01', '2024-01-01')", [("x" * 200,)] * 20000)
+
+    # Another connection keeps writing while the snapshot is created
+    stop_writing = threading.Event()
+    writes = []
+    def write_completions():
+        writer_conn = sqlite3.connect('habits.db')
+        while not stop_writing.is_set():
+            with writer_conn:
+                writer_conn.execute(f"INSERT INTO {table_name} VALUES ('Run', 'I want to run 10km.', 'weekly', '2024-04-01', '2024-04-27')")
+            writes.append(None)
+            time.sleep(0.005)
+        writer_conn.close()
+    writer = threading.Thread(target = write_completions)
+    writer.start()
+    try:
+        while not writes:
+            time.sleep(0.001)
+        steps = []
+        snapshot_path = start_snapshot(tmp_path, pages_per_step = 100, progress = lambda copied, total: steps.append((copied, total))).result(timeout = 30)
+        complete_habit("Read", "2024-04-27", table_name) # the module's connection is not blocked either
+    finally:
+        stop_writing.set()
+        writer.join()
+        conn.close()
+
+    # The copy is not restarted by the writer's commits, so it takes one step per 100 pages
+    pages_total = steps[-1][1]
+    assert steps[-1] == (pages_total, pages_total)
+    assert len(steps) == -(-pages_total // 100)
+    assert [copied for copied, _ in steps] == sorted(copied for copied, _ in steps)
+
+    snapshot_conn = sqlite3.connect(snapshot_path)
+    assert snapshot_conn.execute(f"SELECT COUNT(*) FROM {table_name} WHERE habit_name = 'Filler'").fetchone()[0] == 20000
+    snapshot_conn.close()
+    assert [path.name for path in tmp_path.iterdir()] == [os.path.basename(snapshot_path)]
+
+def test_create_snapshot_failure(setup_habit_data, tmp_path, monkeypatch):
+    def failing_backup(backup_path, **backup_options):
+        open(backup_path, "w").close()
+        raise sqlite3.OperationalError("disk I/O error")
+    monkeypatch.setattr(database, "backup_database", failing_backup)
+    with pytest.raises(sqlite3.OperationalError):
+        create_snapshot(tmp_path)
+    assert list(tmp_path.iterdir()) == [] # the incomplete snapshot is removed
+
+@freeze_time("2024-04-28")
+def test_compact_completions(setup_habit_data):
+    old_dates = ["2024-01-{day:02d}".format(day = day) for day in range(1, 21)] + ["2024-02-01", "2024-02-01"]
+    for date_completed in old_dates:
+        complete_habit("Cook", date_completed, table_name)
+
+    assert compact_completions(62, table_name) == 22
+    assert len(get_dates_completed("Cook", table_name)) == 23 # recent completions only
+    assert len(get_dates_completed("Cook", table_name, include_archived = True)) == 44 # same-day duplicates are merged
+    assert determine_streaks("Cook", table_name) == (2, 20)
+    assert determine_completion("Cook", table_name) == "Yes"
+
+    delete_habit_completion_date("Cook", "2024-01-10", table_name) # splits the archived run of days
+    assert len(get_dates_completed("Cook", table_name, include_archived = True)) == 43
+    assert determine_streaks("Cook", table_name) == (2, 13)
+
+    delete_habit_data("Cook", table_name)
+    assert get_dates_completed("Cook", table_name, include_archived = True) == []
+
+@freeze_time("2024-04-28")
+def test_compact_completions_keeps_recent_periods(setup_habit_data):
+    habit = Habit("Renew passport", "I want to renew my passport.", "every 500 days")
+    habit.date_added = "2023-01-01"
+    insert_habit(habit, table_name)
+    complete_habit("Renew passport", "2023-01-02", table_name) # the current period lasts until 2024-05-14
+
+    compact_completions(7, table_name)
+    assert get_dates_completed("Renew passport", table_name) == [datetime(2023, 1, 2)]
+    assert determine_completion("Renew passport", table_name) == "Yes"
+    assert "Renew passport" not in dict(HabitScheduler(table_name).due_habits())
+
+    # Daily habits keep the horizon, weekly habits also keep the previous week
+    assert len(get_dates_completed("Cook", table_name)) == 6
+    assert len(get_dates_completed("Meet a friend", table_name)) == 2
+    assert determine_streaks("Cook", table_name) == (2, 13)
+    assert determine_streaks("Meet a friend", table_name) == (4, 4)
+
+@pytest.mark.parametrize("habit_periodicity", ["daily", "weekly", "monthly", "every 3 days", "3 times per week"])
+def test_determined_completed_period_runs(habit_periodicity):
+    periodicity = parse_periodicity(habit_periodicity, "2024-01-03")
+    # Short runs of days, and a long run from 2024-02-10 to 2024-05-20
+    completion_days = [day for day in range(datetime(2024, 1, 1).toordinal(), datetime(2024, 6, 30).toordinal())
+                       if day % 11 not in (3, 4, 9) or datetime(2024, 2, 10).toordinal() <= day <= datetime(2024, 5, 20).toordinal()]
+    completed_periods = determine_completed_periods([datetime.fromordinal(day) for day in completion_days], periodicity)
+
+    # The runs cover exactly the periods determined day by day
+    backend = InMemoryBackend()
+    backend.insert_habit(Habit("Stretch", "I want to stretch.", habit_periodicity))
+    for day in completion_days:
+        backend.complete_habit("Stretch", datetime.fromordinal(day).strftime("%Y-%m-%d"))
+    completed_period_runs = determine_completed_period_runs(backend.get_completion_segments("Stretch"), periodicity)
+    assert [period for first_period, last_period in completed_period_runs for period in range(first_period, last_period + 1)] == completed_periods
+
+def test_change_data_capture(setup_habit_data):
+    changes = get_changes_since(0, table_name = table_name)
+    assert len(changes) == 76 # five habits and 71 completions
+    assert [change["sequence"] for change in changes] == sorted(change["sequence"] for change in changes)
+
+    last_sequence = changes[-1]["sequence"]
+    delete_habit_completion_date("Cook", "2024-04-01", table_name)
+    delete_habit_completion_date("Cook", "2024-03-01", table_name) # nothing is deleted, so nothing is logged
+    complete_habit("Swim", "2024-04-01", table_name) # unknown habits are not logged
+    delete_habit_data("Run", table_name)
+    new_changes = get_changes_since(last_sequence, table_name = table_name)
+    assert [change["operation"] for change in new_changes] == ["delete_habit_completion_date", "delete_habit_data"]
+
+    # Apply all changes to another node, twice to check that the result stays the same
+    node_table_name = table_name + "_node"
+    create_table(node_table_name)
+    try:
+        all_changes = get_changes_since(0, table_name = table_name)
+        for _ in range(2):
+            assert apply_changes(all_changes, node_table_name) == new_changes[-1]["sequence"]
+            assert sorted(get_all_habit_names(node_table_name)) == ["Cook", "Go to bed early", "Meet a friend", "Read"]
+            assert len(get_dates_completed("Cook", node_table_name)) == 22
+            assert get_habit_periodicity("Meet a friend", node_table_name) == "weekly"
+
+        node_sequence = get_changes_since(0, table_name = node_table_name)[-1]["sequence"]
+        apply_changes(new_changes, node_table_name)
+        assert get_changes_since(node_sequence, table_name = node_table_name) == [] # nothing changed, so nothing is logged
+    finally:
+        delete_test_tables(node_table_name)
+
+def test_two_way_sync_settles(setup_habit_data):
+    node_table_name = table_name + "_node"
+    create_table(node_table_name)
+    try:
+        assert get_node_id(table_name) != get_node_id(node_table_name)
+        last_sequences = {table_name: get_last_change_sequence(table_name), node_table_name: 0}
+        habit = Habit("Swim", "Swim 1 km", "daily")
+        habit.date_added = "2024-04-01"
+        insert_habit(habit, table_name)
+        complete_habit("Swim", "2024-04-02", table_name)
+        delete_habit_completion_date("Swim", "2024-04-02", table_name)
+
+        def sync(source, target):
+            """
+            Applies the new changes of the source to the target and returns the operations logged there.
+            """
+            changes = get_changes_since(last_sequences[source], table_name = source)
+            target_sequence = get_last_change_sequence(target)
+            last_sequences[source] = apply_changes(changes, target) or last_sequences[source]
+            logged_changes = get_changes_since(target_sequence, table_name = target)
+            # Sending the same changes again does not log anything
+            apply_changes(changes, target)
+            assert get_changes_since(target_sequence, table_name = target) == logged_changes
+            return [change["operation"] for change in logged_changes]
+
+        assert sync(table_name, node_table_name) == ["insert_habit", "complete_habit", "delete_habit_completion_date"]
+        complete_habit("Swim", "2024-04-03", node_table_name)
+        assert sync(node_table_name, table_name) == ["complete_habit"] # the changes of the first node are not applied again
+        for _ in range(3):
+            assert sync(table_name, node_table_name) == []
+            assert sync(node_table_name, table_name) == []
+        assert get_changes_since(last_sequences[table_name], table_name = table_name) == []
+        assert get_changes_since(last_sequences[node_table_name], table_name = node_table_name) == []
+
+        for node in [table_name, node_table_name]:
+            assert [date.strftime("%Y-%m-%d") for date in get_dates_completed("Swim", node)] == ["2024-04-03"]
+            # Every change is logged once per node, with the node it was made on
+            origins = [(change["origin_node"], change["origin_sequence"]) for change in get_changes_since(0, table_name = node)]
+            assert len(origins) == len(set(origins))
+    finally:
+        delete_test_tables(node_table_name)
+
 @pytest.mark.parametrize("habit_name, expected_completion", [
     ("Cook", "Yes"), 
     ("Read", "No"), 
@@ -166,6 +480,61 @@ def test_determined_streaks(setup_habit_data, habit_name, expected_current_strea
     determined_longest_streak = determined_streaks[1]
     assert determined_longest_streak == expected_longest_sreak
 
+@pytest.mark.parametrize("habit_name, expected_completion, expected_streaks", [
+    ("Cook", "Yes", (2, 13)),
+    ("Read", "No", (0, 12)),
+    ("Meet a friend", "Yes", (4, 4))
+])
+@freeze_time("2024-04-28")
+def test_analysis_with_backends(setup_habit_data, in_memory_backend, habit_name, expected_completion, expected_streaks):
+    for backend in [SQLiteBackend(table_name), in_memory_backend]:
+        assert determine_completion(habit_name, backend = backend) == expected_completion
+        assert determine_streaks(habit_name, backend = backend) == expected_streaks
+
+def test_in_memory_backend(in_memory_backend):
+    assert len(in_memory_backend.get_all_habit_names()) == 5
+    assert len(in_memory_backend.get_habit_names_by_periodicity("weekly")) == 2
+    assert in_memory_backend.get_habit_task_specification("Run") == "I want to run 10km."
+
+    version = in_memory_backend.get_data_version()
+    in_memory_backend.delete_habit_completion_date("Cook", "2024-04-01")
+    assert len(in_memory_backend.get_dates_completed("Cook")) == 22
+    assert in_memory_backend.get_data_version() != version
+
+    in_memory_backend.delete_habit_data("Cook")
+    assert len(in_memory_backend.get_all_habit_names()) == 4
+
+@freeze_time("2024-04-28")
+def test_sharded_backend(setup_habit_data, tmp_path):
+    sharded_backend = ShardedBackend.in_directory(tmp_path, 3, table_name)
+    for name, description, periodicity in habits:
+        sharded_backend.insert_habit(Habit(name, description, periodicity))
+    sharded_backend.complete_habits((habit_name, date_completed) for habit_name, dates in habit_completions.items() for date_completed in dates)
+
+    # Every habit lives in exactly one shard, chosen by its name
+    reopened_backend = ShardedBackend.in_directory(tmp_path, 3, table_name)
+    assert reopened_backend.shard_index("Cook") == sharded_backend.shard_index("Cook")
+    assert reopened_backend.get_habit_periodicity("Cook") == "daily"
+    reopened_backend.close()
+    expected_shard_indexes = {"Cook": 0, "Read": 1, "Go to bed early": 1, "Meet a friend": 1, "Run": 1}
+    assert {name: sharded_backend.shard_index(name) for name, _, _ in habits} == expected_shard_indexes
+    for index, shard in enumerate(sharded_backend.shards):
+        assert sorted(shard.get_all_habit_names()) == sorted(name for name, shard_index in expected_shard_indexes.items() if shard_index == index)
+        assert sum(len(shard.get_dates_completed(name)) for name in shard.get_all_habit_names()) == \
+            sum(len(habit_completions[name]) for name, shard_index in expected_shard_indexes.items() if shard_index == index)
+    assert sorted(sharded_backend.get_all_habit_names()) == sorted(name for name, _, _ in habits)
+    assert sharded_backend.get_all_habit_periodicities() == ["daily", "weekly"]
+
+    assert len(sharded_backend.get_dates_completed("Cook")) == 23
+    assert determine_streaks("Cook", backend = sharded_backend) == (2, 13)
+    assert sorted(create_overview_rows("all", backend = sharded_backend)) == sorted(create_overview_rows("all", table_name))
+
+    version = sharded_backend.get_data_version()
+    sharded_backend.delete_habit_data("Run")
+    assert sharded_backend.get_data_version() != version
+    assert len(create_overview_rows("weekly", backend = sharded_backend)) == 1
+    sharded_backend.close()
+
 @freeze_time("2025-01-02")
 def test_determined_streaks_across_years_daily(setup_habit_data):
     complete_habit("Cook", "2024-12-31", table_name)
@@ -199,6 +568,120 @@ def test_determined_streaks_across_years_weekly(setup_habit_data):
     determined_longest_streak = determined_streaks[1]
     assert determined_longest_streak == 3 # longest streak should now be updated to 3
 
+@freeze_time("2024-04-28")
+def test_determined_streaks_custom_periodicities(setup_habit_data):
+    add_habit("Swim", "I want to swim twice a week.", "2 times per week", table_name)
+    for date_completed in ["2024-04-02", "2024-04-03", "2024-04-09", "2024-04-10", "2024-04-10", "2024-04-16", "2024-04-25"]:
+        complete_habit("Swim", date_completed, table_name)
+    assert determine_completion("Swim", table_name) == "No" # only one swim in the current week
+    assert determine_streaks("Swim", table_name) == (0, 2) # the week of 2024-04-15 had only one distinct day
+
+    add_habit("Review", "I want to review my month.", "monthly", table_name)
+    for date_completed in ["2023-12-31", "2024-01-30", "2024-02-02", "2024-03-15", "2024-04-01"]:
+        complete_habit("Review", date_completed, table_name)
+    assert determine_completion("Review", table_name) == "Yes"
+    assert determine_streaks("Review", table_name) == (5, 5) # streak continues across years
+
+    add_habit("Water plants", "I want to water the plants.", "every 3 days", table_name)
+    complete_habit("Water plants", "2024-04-28", table_name) # periods start on the day the habit was added
+    assert determine_completion("Water plants", table_name) == "Yes"
+    assert determine_streaks("Water plants", table_name) == (1, 1)
+    assert "Water plants" not in dict(HabitScheduler(table_name).due_habits())
+    with freeze_time("2024-04-30"):
+        assert determine_completion("Water plants", table_name) == "Yes"
+    with freeze_time("2024-05-01"):
+        assert determine_completion("Water plants", table_name) == "No"
+        assert determine_streaks("Water plants", table_name) == (1, 1)
+        assert dict(HabitScheduler(table_name).due_habits())["Water plants"] == datetime(2024, 5, 1).date()
+
+def test_parse_periodicity():
+    assert parse_periodicity("3x per week").quota == 3
+    with pytest.raises(ValueError):
+        parse_periodicity("8 times per week")
+    with pytest.raises(ValueError):
+        add_habit("Dance", "Go to dancing a class", "fortnightly", table_name)
+
+@freeze_time("2024-04-28")
+def test_habit_scheduler(setup_habit_data):
+    habit_scheduler = HabitScheduler(table_name)
+    assert len(habit_scheduler) == 5
+    assert habit_scheduler.create_reminders() == [
+        "\"Run\" is due since 2024-04-15.",
+        "\"Read\" is due since 2024-04-27.",
+        "\"Go to bed early\" is due since 2024-04-28."
+    ]
+
+    complete_habit("Go to bed early", "2024-04-28", table_name)
+    habit_scheduler.refresh("Go to bed early")
+    delete_habit_data("Run", table_name)
+    habit_scheduler.remove("Run")
+    assert [habit_name for habit_name, _ in habit_scheduler.due_habits()] == ["Read"]
+
+    # On the next day, a new week starts, so all remaining habits are due again
+    assert len(habit_scheduler.due_habits(datetime(2024, 4, 29))) == 4
+
+@freeze_time("2024-04-28")
+def test_habit_scheduler_after_compaction(setup_habit_data):
+    habit = Habit("Water plants", "Water all plants", "daily")
+    habit.date_added = "2022-05-01"
+    insert_habit(habit, table_name)
+    complete_habit("Water plants", "2022-06-01", table_name)
+    before_compaction = HabitScheduler(table_name).create_reminders()
+    assert before_compaction[0] == "\"Water plants\" is due since 2022-06-02."
+
+    # Archived completions still determine when a habit is due, so the longest overdue habit stays first
+    compact_completions(table_name = table_name)
+    habit_scheduler = HabitScheduler(table_name)
+    assert habit_scheduler.create_reminders() == before_compaction
+    habit_scheduler.refresh("Water plants")
+    assert habit_scheduler.create_reminders() == before_compaction
+
+@freeze_time("2024-04-28")
+def test_determined_habit_statistics(setup_habit_data):
+    complete_habit("Cook", "2024-04-28", table_name) # second completion on the same day is ignored
+    complete_habit("Run", "2023-12-01", table_name)
+    compact_completions(62, table_name) # archived completions are included
+    add_habit("Dance", "Go to dancing a class", "weekly", table_name)
+
+    all_statistics = determine_habit_statistics(table_name)
+    assert len(all_statistics) == 6
+
+    cook_statistics = all_statistics["Cook"]
+    assert cook_statistics["total_completions"] == 23
+    assert cook_statistics["maximum_gap"] == 3
+    assert cook_statistics["adherence"] == 23 / 28
+
+    run_statistics = all_statistics["Run"]
+    assert run_statistics["first_completion"] == "2023-12-01"
+    assert run_statistics["last_completion"] == "2024-04-12"
+    assert run_statistics["average_gap"] == 66.5
+    assert run_statistics["weekday_distribution"] == [0, 0, 0, 1, 2, 0, 0]
+
+    dance_statistics = all_statistics["Dance"]
+    assert dance_statistics["total_completions"] == 0
+    assert dance_statistics["adherence"] is None # added in the current week
+
+@freeze_time("2024-04-28")
+def test_determined_habit_statistics_with_overlapping_history(setup_habit_data):
+    habit = Habit("Swim", "Swim 1 km", "daily")
+    habit.date_added = "2024-01-01"
+    insert_habit(habit, table_name)
+    for day in range(1, 11):
+        complete_habit("Swim", "2024-01-{day:02d}".format(day = day), table_name)
+    compact_completions(62, table_name)
+    complete_habit("Swim", "2024-01-05", table_name) # archived dates are not stored again
+    assert get_dates_completed("Swim", table_name) == []
+
+    # Completions stored before may still overlap the archive
+    conn = sqlite3.connect('habits.db')
+    with conn:
+        conn.execute(f"INSERT INTO {table_name} VALUES ('Swim', 'Swim 1 km', 'daily', '2024-01-01', '2024-01-05')")
+    conn.close()
+    swim_statistics = determine_habit_statistics(table_name)["Swim"]
+    assert swim_statistics["total_completions"] == 10
+    assert swim_statistics["last_completion"] == "2024-01-10"
+    assert swim_statistics["average_gap"] == 1.0
+
 def test_add_habit(setup_habit_data):
     habits = get_all_habit_names(table_name)
     assert len(habits) == 5
@@ -222,10 +705,161 @@ def test_create(setup_habit_data):
     available_dates = create_list_of_available_completion_dates("Meet a friend", table_name)
     assert len(available_dates) == 12 # only completed: 2024-04-15, 2024-04-26
 
+def test_habit_name_index(setup_habit_data):
+    habit_index = HabitNameIndex(get_all_habit_names(table_name))
+    assert habit_index.search_prefix("r") == ["Read", "Run"] # prefix search ignores case
+    assert habit_index.search("gtb") == ["Go to bed early"] # fuzzy search matches characters in order
+    assert habit_index.search("co", limit = 1) == ["Cook"]
+
+    habit_index.add("Rest")
+    habit_index.remove("Run")
+    assert habit_index.search_prefix("R") == ["Read", "Rest"]
+    assert "Run" not in habit_index and len(habit_index) == 5
+    assert habit_index.search("un") == [] # removed names are not found by fuzzy search either
+
+def test_habit_name_index_fuzzy_candidates():
+    habit_index = HabitNameIndex(["Habit {number}".format(number = number) for number in range(10000)] + ["Go to bed early"])
+    # Only names containing 'g', 't' and 'b' are checked
+    assert habit_index.search("gtb") == ["Go to bed early"]
+    # Names are checked in the order they were indexed, so the matches do not depend on the hash seed
+    assert habit_index.search("h7", limit = 3) == ["Habit 1007", "Habit 1017", "Habit 1027"]
+    assert HabitNameIndex(habit_index.search_prefix("H", 10000), fuzzy_scan_limit = 0).search("ht1") == [] # the fuzzy scan is capped
+
+def test_create_overview_rows_cache(setup_habit_data):
+    with freeze_time("2024-04-28"):
+        overview_rows = create_overview_rows("all", table_name)
+        assert len(overview_rows) == 5
+        assert create_overview_rows("all", table_name) is overview_rows # cached result is reused
+
+        complete_habit("Read", "2024-04-28", table_name) # any write invalidates the cache
+        updated_overview_rows = create_overview_rows("all", table_name)
+        assert updated_overview_rows is not overview_rows
+        assert ("Read", "I want to read 30 minutes.", "daily", "Yes", "1", "12") in updated_overview_rows
+
+    with freeze_time("2024-04-29"): # a new day invalidates the cache
+        assert ("Read", "I want to read 30 minutes.", "daily", "No", "1", "12") in create_overview_rows("all", table_name)
+
 @freeze_time("2024-04-28")
 def test_create_overview_table(setup_habit_data):
     create_overview_table("all", "Longest Streak", table_name) # program is able to print overview table
 
+@freeze_time("2024-04-28")
+def test_create_heatmaps(setup_habit_data):
+    heatmaps = create_heatmaps(days = 28, table_name = table_name)
+    assert len(heatmaps) == 5
+    assert "Cook (23 of 28 days completed)" in heatmaps[0].plain
+    assert len(heatmaps[0].plain.splitlines()) == 9 # title, months and one line per weekday
+    assert [heatmap.plain.split(" (")[0] for heatmap in create_heatmaps(["Run", "Cook"], days = 28, table_name = table_name)] == ["Run", "Cook"]
+
+def test_show_heatmaps_time_budget(setup_habit_data):
+    # The time is not frozen, because freezegun also freezes time.perf_counter()
+    first_day = datetime.today() - timedelta(days = 364)
+    time_budget = 1.0 # seconds
+
+    # A few hundred habits, each completed in runs of 20 out of 30 days for a year
+    enable_completion_buffer(max_size = 100000)
+    try:
+        for number in range(200):
+            habit = Habit("Habit {number}".format(number = number), "Test the heatmaps", "daily")
+            habit.date_added = first_day.strftime("%Y-%m-%d")
+            insert_habit(habit, table_name)
+            for day in range(365):
+                if (day + number) % 30 < 20:
+                    complete_habit(habit.habit_name, (first_day + timedelta(days = day)).strftime("%Y-%m-%d"), table_name)
+    finally:
+        disable_completion_buffer()
+
+    output = io.StringIO()
+    start = time.perf_counter()
+    show_heatmaps(table_name = table_name, console = Console(file = output, force_terminal = True, width = 120))
+    assert time.perf_counter() - start < time_budget
+    # Every habit is displayed, none is left out
+    assert output.getvalue().count("days completed)") == 205
+    assert "Habit 199" in output.getvalue()
+
+@freeze_time("2024-07-01")
+def test_get_all_completion_segments(setup_habit_data):
+    compact_completions(horizon_days = 62, table_name = table_name)
+    complete_habit("Read", "2024-06-30", table_name)
+    all_completion_segments = get_all_completion_segments("2024-04-10", "2024-06-30", table_name)
+    assert list(all_completion_segments) == sorted(name for name, _, _ in habits)
+
+    # Archived runs are clipped to the date range
+    first_day = datetime(2024, 4, 10).toordinal()
+    assert all_completion_segments["Cook"][0] == (first_day, first_day)
+    assert bin(create_completion_bitmap(all_completion_segments["Cook"], first_day)).count("1") == 16
+    assert bin(create_completion_bitmap(all_completion_segments["Read"], first_day)).count("1") == 16
+
+@freeze_time("2024-04-28")
+def test_api(setup_habit_data, monkeypatch):
+    server = create_server(port = 0, table_name = table_name, pool_size = 2)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    base_url = "http://127.0.0.1:{port}".format(port = server.server_address[1])
+
+    def get(path, etag = None):
+        request = urllib.request.Request(base_url + path, headers = {"If-None-Match": etag} if etag else {})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.headers["ETag"], json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers["ETag"], None
+
+    try:
+        status, etag, habits_data = get("/habits")
+        assert status == 200 and len(habits_data) == 5
+        assert get("/habits/Cook/streaks")[2] == {"habit_name": "Cook", "completed": "Yes", "current_streak": 2, "longest_streak": 13}
+        assert len(get("/habits/Meet%20a%20friend/completions")[2]) == 4
+        assert len(get("/overview?periodicity=weekly")[2]) == 2
+        assert get("/habits/Swim/streaks")[0] == 404
+        assert get("/overview?periodicity=yearly")[0] == 400
+
+        # Unchanged data is not sent again, until the data changes
+        assert get("/habits", etag)[:2] == (304, etag)
+        complete_habit("Read", "2024-04-28", table_name)
+        status, new_etag, _ = get("/habits", etag)
+        assert status == 200 and new_etag != etag
+        assert get("/habits/Read/streaks", new_etag)[0] == 304
+
+        # A response whose data changes while it is built is neither cached nor sent with the old ETag
+        create_response_data = HabitRequestHandler.create_response_data
+        writer = sqlite3.connect('habits.db', check_same_thread = False)
+        def create_response_data_during_write(handler, backend, path_parts, query):
+            data = create_response_data(handler, backend, path_parts, query)
+            complete_habit("Read", "2024-04-27", table_name, writer)
+            return data
+        monkeypatch.setattr(HabitRequestHandler, "create_response_data", create_response_data_during_write)
+        status, changed_etag, _ = get("/habits/Read/completions")
+        assert status == 200 and changed_etag is None
+        assert not any(path == "/habits/Read/completions" for path, _ in server.response_cache)
+        monkeypatch.undo()
+        writer.close()
+        status, etag, completions = get("/habits/Read/completions", new_etag)
+        assert status == 200 and etag != new_etag and "2024-04-27" in completions
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_percentile():
+    latencies_sorted = [float(latency) for latency in range(1, 101)]
+    assert percentile(latencies_sorted, 50) == 50.0
+    assert percentile(latencies_sorted, 99) == 99.0
+    assert percentile([], 99) == 0.0
+    assert percentile([float(latency) for latency in range(1, 1061)], 99) == 1050.0 # the rank is rounded up
+
+def test_run_load_test(tmp_path):
+    report = run_load_test(workers = 2, operations_per_worker = 25, database_file = tmp_path / "load_test.db")
+    measured_operations = sum(measurements["count"] + measurements["lock_errors"] for measurements in report["operations"].values())
+    assert measured_operations == 50
+    assert report["throughput"] > 0
+
+def test_run_buffer_benchmark(tmp_path):
+    report = run_buffer_benchmark(completions = 200, database_file = tmp_path / "buffer_benchmark.db")
+    assert report["unbuffered"] > 0 and report["buffered"] > 0
+    assert report["speedup"] == report["buffered"] / report["unbuffered"]
+    conn = sqlite3.connect(tmp_path / "buffer_benchmark.db")
+    assert conn.execute("SELECT COUNT(*) FROM habits WHERE date_completed IS NOT NULL").fetchone()[0] == 400 # every completion is written
+    conn.close()
+
 # Run the tests
 pytest.main()
 